@@ -1,13 +1,11 @@
 import streamlit as st
-from utils.auth import get_supabase_admin_client
 import re
 from datetime import datetime
 from zoneinfo import ZoneInfo
-from collections import Counter
-import plotly.express as px
-import pandas as pd
 import html
 from classes_def import stage_insights, stages_info, classes
+from utils.config import RECORDS_PAGE_SIZE
+from utils import cleanup, metrics, repository
 
 def is_valid_uuid(val):
     uuid_regex = re.compile(
@@ -15,7 +13,79 @@ def is_valid_uuid(val):
     )
     return bool(uuid_regex.match(val))
 
+def format_created_at(created_at: str, fmt: str = "%b %d, %Y %I:%M %p") -> str:
+    """Format a Supabase ISO timestamp in Philippine time"""
+    try:
+        # Parse ISO string with timezone info (if any)
+        dt_utc = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
+    except ValueError:
+        return "Invalid date"
+    return dt_utc.astimezone(ZoneInfo("Asia/Manila")).strftime(fmt)
+
+def to_display_record(record: dict) -> dict:
+    created_at = record.get("created_at")
+    return {
+        "id": record["id"],
+        "image_path": record["image_path"],
+        "thumbnail_path": record.get("thumbnail_path"),
+        "prediction": record["prediction"],
+        "confidence": record["confidence"],
+        "created_at_str": format_created_at(created_at) if created_at else "Unknown date",
+    }
+
+@st.fragment
+def render_record_list(child_id: str, user_id: str):
+    """Show a child's records a page at a time, newest first"""
+    # Loaded pages survive reruns; "Load More" only reruns this fragment
+    state_key = f"record_pages_{child_id}"
+    if state_key not in st.session_state:
+        with metrics.span("records_page_fetch", RECORDS_PAGE_SIZE):
+            rows, cursor = repository.get_results_page(child_id, RECORDS_PAGE_SIZE)
+        st.session_state[state_key] = {"records": [to_display_record(r) for r in rows], "cursor": cursor}
+    pages = st.session_state[state_key]
+
+    # Display each record with image, prediction, confidence, date, and delete button
+    for record in pages["records"]:
+        cols = st.columns([2, 2, 1])
+
+        with cols[0]:
+            st.markdown(f"<small style='color:gray;'>Date Analyzed: {record['created_at_str']}</small>", unsafe_allow_html=True)
+            # Thumbnail first; the full drawing is only downloaded when asked for
+            st.image(record["thumbnail_path"] or record["image_path"], width=250)
+            if record["thumbnail_path"] and st.toggle("Show full image", key=f"full_{record['id']}"):
+                st.image(record["image_path"], use_container_width=True)
+
+        with cols[1]:
+            st.markdown(f"**Prediction:** {record['prediction']}")
+            st.markdown(f"**Confidence:** {record['confidence']:.2f}%")
+
+        with cols[2]:
+            delete_key = f"delete_{record['id']}"
+            if st.button("Delete Record", key=delete_key):
+                try:
+                    if cleanup.delete_result(user_id, child_id, record["id"]):
+                        st.session_state.pop(state_key, None)
+                        st.success("Record deleted successfully.")
+                        st.rerun()
+                    else:
+                        st.error("Failed to delete the record: No data returned.")
+                except Exception as e:
+                    st.error(f"Failed to delete the record: {e}")
+
+        st.markdown("---")
+
+    if pages["cursor"] and st.button("Load More", key=f"load_more_{child_id}", use_container_width=True):
+        with metrics.span("records_page_fetch", RECORDS_PAGE_SIZE):
+            rows, cursor = repository.get_results_page(child_id, RECORDS_PAGE_SIZE, after=pages["cursor"])
+        pages["records"].extend(to_display_record(r) for r in rows)
+        pages["cursor"] = cursor
+        st.rerun(scope="fragment")
+
 def render_child_records(child_id: str):
+    with metrics.span("records_load"):
+        _render_child_records(child_id)
+
+def _render_child_records(child_id: str):
     if not child_id:
         st.error("No child ID provided.")
         return
@@ -24,68 +94,42 @@ def render_child_records(child_id: str):
         st.error("Invalid child ID.")
         return
 
-    supabase_admin = get_supabase_admin_client()
     user_id = st.session_state['user']['id']
 
-    # Fetch child info
-    child_resp = supabase_admin.table("children").select("name").eq("id", child_id).eq("user_id", user_id).execute()
-    if not child_resp.data:
+    # Fetch child info (already loaded this run if the Analyze page listed it)
+    child = repository.get_child(user_id, child_id)
+    if not child:
         st.error("Child record not found or access denied.")
         return
 
-    child_name = child_resp.data[0]["name"]
+    child_name = child["name"]
     st.markdown(f"<h5 style='text-align: center;'>Records for {child_name}</h5>", unsafe_allow_html=True)
 
     # Top Back Button
     if st.button("⬅️ Back to Analyze"):
         st.session_state.pop('selected_child_id', None)
+        st.session_state.pop(f"record_pages_{child_id}", None)
         st.rerun()
 
-    # Fetch results
-    results_resp = supabase_admin.table("results").select("*").eq("child_id", child_id).order("created_at", desc=True).execute()
-    results = results_resp.data if results_resp.data else []
+    # Stage and per-day counts aggregated by the database
+    with metrics.span("records_summary_fetch"):
+        summary = repository.get_child_summary(child_id)
 
-    if not results:
+    if not summary["total"]:
         st.markdown("<h6 style='text-align: center;'>No analysis records found for this child.</h6>", unsafe_allow_html=True)
         # Bottom Back Button as well here
         if st.button("⬅️ Back to Analyze", key="back_bottom"):
             st.session_state.pop('selected_child_id', None)
+            st.session_state.pop(f"record_pages_{child_id}", None)
             st.rerun()
         return
 
-    # Prepare data for summary & chart
-    records_for_chart = []
-    for record in results:
-        created_at = record.get("created_at")
-        if created_at:
-            try:
-                # Parse ISO string with timezone info (if any)
-                dt_utc = datetime.fromisoformat(created_at.replace("Z", "+00:00"))
-                dt_pht = dt_utc.astimezone(ZoneInfo("Asia/Manila"))
-                created_str = dt_pht.strftime("%b %d, %Y %I:%M %p")
-                created_date = dt_pht.date()
-            except ValueError:
-                created_str = "Invalid date"
-                created_date = None
-        else:
-            created_str = "Unknown date"
-            created_date = None
-
-        records_for_chart.append({
-            "id": record["id"],
-            "image_path": record["image_path"],
-            "prediction": record["prediction"],
-            "confidence": record["confidence"],
-            "created_at_str": created_str,
-            "created_date": created_date
-        })
-
     # --- Generate Summary Text ---
-    pred_counts = Counter(r['prediction'] for r in records_for_chart)
+    pred_counts = {row['prediction']: row['count'] for row in summary["stage_counts"]}
 
     if pred_counts:
         summary_lines = []
-        total = sum(pred_counts.values())
+        total = summary["total"]
         summary_lines.append(f"This child has {total} analyzed drawing(s) categorized into:")
 
         for pred, count in pred_counts.items():
@@ -99,7 +143,7 @@ def render_child_records(child_id: str):
             description = stages_info.get(matching_key, "No description available.")
             summary_lines.append(f"- **{html.escape(pred)}**: {count} record(s). {description}")
 
-        most_common_pred = pred_counts.most_common(1)[0][0]
+        most_common_pred = summary["most_common"]
         insight = stage_insights.get(most_common_pred, "")
 
         summary_md = "\n\n".join(summary_lines)
@@ -118,14 +162,15 @@ def render_child_records(child_id: str):
         st.markdown("<p>No predictions to summarize.</p>")
 
     # --- Plotly Chart ---
-    # Create dataframe for chart: counts per prediction per date
-    df = pd.DataFrame(records_for_chart)
-    if df.empty:
+    import pandas as pd
+    import plotly.express as px
+
+    # Counts per prediction per date, already grouped by the database
+    df_grouped = pd.DataFrame(summary["daily"])
+    if df_grouped.empty:
         st.info("No data to plot.")
     else:
-        df_grouped = df.groupby(['created_date', 'prediction']).size().reset_index(name='count')
-        # Sort dates ascending
-        df_grouped = df_grouped.sort_values('created_date')
+        df_grouped['created_date'] = pd.to_datetime(df_grouped['created_date'])
 
         fig = px.bar(df_grouped,
                      x='created_date',
@@ -147,34 +192,10 @@ def render_child_records(child_id: str):
 
     st.markdown(f"<h5>Review {child_name}'s Records Below</h5>", unsafe_allow_html=True)
 
-    # Display each record with image, prediction, confidence, date, and delete button
-    for record in records_for_chart:
-        cols = st.columns([2, 2, 1])
-
-        with cols[0]:
-            st.markdown(f"<small style='color:gray;'>Date Analyzed: {record['created_at_str']}</small>", unsafe_allow_html=True)
-            st.image(record["image_path"], width=250)
-
-        with cols[1]:
-            st.markdown(f"**Prediction:** {record['prediction']}")
-            st.markdown(f"**Confidence:** {record['confidence']:.2f}%")
-
-        with cols[2]:
-            delete_key = f"delete_{record['id']}"
-            if st.button("Delete Record", key=delete_key):
-                try:
-                    delete_resp = supabase_admin.table("results").delete().eq("id", record["id"]).execute()
-                    if delete_resp.data is not None:
-                        st.success("Record deleted successfully.")
-                        st.rerun()
-                    else:
-                        st.error("Failed to delete the record: No data returned.")
-                except Exception as e:
-                    st.error(f"Failed to delete the record: {e}")
-
-        st.markdown("---")
+    render_record_list(child_id, user_id)
 
     # Bottom Back Button
     if st.button("⬅️ Back to Analyze", key="back_bottom"):
         st.session_state.pop('selected_child_id', None)
+        st.session_state.pop(f"record_pages_{child_id}", None)
         st.rerun()
@@ -3,21 +3,23 @@
 import streamlit as st
 st.set_page_config(page_title="Drawee", page_icon="🖼️")
 
-from st_supabase_connection import SupabaseConnection
-import numpy as np
-import plotly.graph_objects as go
-import time
-from PIL import Image
-import cv2
-from tensorflow.keras.models import load_model
 from utils.auth import login, signup, is_authenticated, logout, get_supabase_client, get_supabase_admin_client
 from classes_def import stages_info
+from utils.model import start_warm_up
+from utils.metrics import start_exporter
+from utils.journal import start_flusher
 
 
 # --- Connect to Supabase ---
 supabase = get_supabase_client()
 supabase_admin = get_supabase_admin_client()
 
+# Start loading the model as soon as the first visitor hits the app
+start_warm_up()
+start_exporter()
+# Push uploads and results journaled before a restart
+start_flusher()
+
 # --- Streamlit UI ---
 
 # --- Custom CSS Styling ---
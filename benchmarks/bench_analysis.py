@@ -0,0 +1,205 @@
+"""Measure decode, preprocessing and prediction latency of the analysis path.
+
+Runs offline on seeded synthetic drawings. The real model is used when its
+verified weights are in model_cache/, a stand-in of the same shape otherwise.
+Run from the repository root, then compare a later run against the result:
+
+    python -m benchmarks.bench_analysis --json baseline.json
+    python -m benchmarks.bench_analysis --baseline baseline.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from benchmarks.synthetic import encode, make_drawing
+from utils import model as model_module
+from utils.config import MODEL_BACKEND, PREPROCESS_WORKERS
+from utils.model_fetch import is_verified, load_manifest
+from utils.preprocess import allocate_batch, decode_image, preprocess_into
+
+# Lower is better for latencies, higher for throughput
+LATENCY_KEYS = ("p50_ms", "p95_ms", "p99_ms")
+THROUGHPUT_KEYS = ("images_per_second",)
+
+
+def weights_available() -> bool:
+    """Whether verified weights for the configured backend are on disk"""
+    path = model_module.model_path()
+    entry = load_manifest()["artifacts"].get(MODEL_BACKEND)
+    if entry is None:
+        return os.path.exists(path)
+    return is_verified(path, entry)
+
+
+def load_model(stand_in: bool):
+    """Return the model through get_model(), installing the stand-in first if asked or needed"""
+    if stand_in or not weights_available():
+        from benchmarks.stand_in import StandInBackend
+
+        model_module.set_model(StandInBackend().load())
+        return model_module.get_model(), True
+    return model_module.get_model(), False
+
+
+def summarize(timings: list, images_per_call: int = 1) -> dict:
+    """Return p50/p95/p99 latency in ms and throughput for a list of per-call seconds"""
+    timings = np.asarray(timings)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99]) * 1000
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "images_per_second": round(images_per_call * len(timings) / float(timings.sum()), 2),
+        "calls": len(timings),
+    }
+
+
+def time_calls(fn, repeats: int) -> list:
+    fn()  # warm caches, lazy imports and the model's first trace
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def bench_steps(uploads: dict, model, batch_sizes: list, repeats: int, workers: int) -> dict:
+    steps = {"decode": {}, "preprocess": {}, "predict": {}, "end_to_end": {}}
+
+    for size, data in uploads.items():
+        steps["decode"][size] = summarize(time_calls(lambda: decode_image(data[0]), repeats))
+        img = decode_image(data[0])
+        out = allocate_batch(1)
+        steps["preprocess"][size] = summarize(time_calls(lambda: preprocess_into(img, out[0]), repeats))
+
+    rng = np.random.default_rng(0)
+    for batch_size in batch_sizes:
+        images = rng.random((batch_size, *model_module.INPUT_SHAPE), dtype=np.float32)
+        steps["predict"][f"batch_{batch_size}"] = summarize(
+            time_calls(lambda: model.predict(images), repeats), batch_size
+        )
+
+    # Decode and preprocess in parallel into one batch, then one forward pass, like utils.analysis
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for size, data in uploads.items():
+            for batch_size in batch_sizes:
+                batch = allocate_batch(batch_size)
+
+                def analyze():
+                    def preprocess(idx):
+                        preprocess_into(decode_image(data[idx % len(data)]), batch[idx])
+
+                    list(executor.map(preprocess, range(batch_size)))
+                    model.predict(batch)
+
+                steps["end_to_end"][f"{size}/batch_{batch_size}"] = summarize(
+                    time_calls(analyze, max(1, repeats // 4)), batch_size
+                )
+    return steps
+
+
+def peak_rss_mb() -> float:
+    try:
+        import resource
+        # ru_maxrss is reported in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return model_module.current_rss_mb()
+
+
+def flatten(report: dict, prefix: str = "") -> dict:
+    """Map dotted metric names to values for every latency and throughput figure"""
+    flat = {}
+    for key, value in report.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif key in LATENCY_KEYS + THROUGHPUT_KEYS:
+            flat[name] = value
+    return flat
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Return (metric, baseline, current) for every figure that got worse by more than tolerance"""
+    current = flatten(report["steps"])
+    regressions = []
+    for name, expected in flatten(baseline["steps"]).items():
+        actual = current.get(name)
+        if actual is None or not expected:
+            continue
+        if name.endswith(LATENCY_KEYS) and actual > expected * (1 + tolerance):
+            regressions.append((name, expected, actual))
+        elif name.endswith(THROUGHPUT_KEYS) and actual < expected * (1 - tolerance):
+            regressions.append((name, expected, actual))
+    if baseline.get("peak_rss_mb") and report["peak_rss_mb"] > baseline["peak_rss_mb"] * (1 + tolerance):
+        regressions.append(("peak_rss_mb", baseline["peak_rss_mb"], report["peak_rss_mb"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="640x480,1920x1080,4000x3000")
+    parser.add_argument("--batch-sizes", default="1,4,16,64")
+    parser.add_argument("--format", default=".jpg", choices=[".jpg", ".png"])
+    parser.add_argument("--repeats", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=PREPROCESS_WORKERS)
+    parser.add_argument("--stand-in", action="store_true", help="use the stand-in model even if weights exist")
+    parser.add_argument("--json", default="", help="write the report to this file")
+    parser.add_argument("--baseline", default="", help="exit non-zero if worse than this report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    batch_sizes = [int(v) for v in args.batch_sizes.split(",")]
+    uploads = {}
+    for size in args.sizes.split(","):
+        width, height = (int(v) for v in size.split("x"))
+        # A few distinct drawings per size so decode does not hit one warm buffer
+        uploads[size] = [encode(make_drawing(width, height, seed), args.format) for seed in range(4)]
+
+    model, stand_in = load_model(args.stand_in)
+    report = {
+        "model": {"version": model_module.MODEL_VERSION, "backend": model.name, "stand_in": stand_in},
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "workers": args.workers,
+            "format": args.format,
+        },
+        "steps": bench_steps(uploads, model, batch_sizes, args.repeats, args.workers),
+    }
+    report["peak_rss_mb"] = round(peak_rss_mb(), 1)
+
+    print(f"{'step':<34}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'img/s':>10}")
+    for step, cases in report["steps"].items():
+        for case, r in cases.items():
+            print(f"{step + ' ' + case:<34}{r['p50_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+                  f"{r['p99_ms']:>10.2f}{r['images_per_second']:>10.1f}")
+    print(f"peak RSS {report['peak_rss_mb']:.0f} MB, model {model.name}{' (stand-in)' if stand_in else ''}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get("model", {}).get("backend") != report["model"]["backend"]:
+            print(f"warning: baseline used the {baseline.get('model', {}).get('backend')} model")
+        regressions = compare(report, baseline, args.tolerance)
+        for name, expected, actual in regressions:
+            print(f"REGRESSION {name}: {expected} -> {actual}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Compare the legacy PIL/float64 preprocessing against utils.preprocess.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_preprocess --repeats 50
+"""
+import io
+import time
+import argparse
+import statistics
+import tracemalloc
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from benchmarks.synthetic import encode, make_drawing
+from utils.preprocess import allocate_batch, decode_image, preprocess_into
+
+
+def legacy_preprocess(data: bytes) -> np.ndarray:
+    """The original Analyze page path: PIL decode, cv2 resize, float64 divide"""
+    im = Image.open(io.BytesIO(data)).convert("RGB")
+    img = np.asarray(im)
+    resized_img = cv2.resize(img, (256, 256))
+    resized_img = resized_img / 255.0
+    return np.expand_dims(resized_img, axis=0)
+
+
+def make_current_preprocess():
+    batch = allocate_batch(1)
+
+    def current_preprocess(data: bytes) -> np.ndarray:
+        preprocess_into(decode_image(data), batch[0])
+        return batch
+
+    return current_preprocess
+
+
+def measure(fn, data: bytes, repeats: int) -> dict:
+    fn(data)  # warm caches and lazy imports
+
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(data)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    out = fn(data)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    stats = after.compare_to(before, "lineno")
+
+    return {
+        "median_ms": statistics.median(timings) * 1000,
+        "p95_ms": sorted(timings)[int(0.95 * (len(timings) - 1))] * 1000,
+        "allocations": sum(max(s.count_diff, 0) for s in stats),
+        "peak_traced_kb": peak / 1024,
+        "output_dtype": str(out.dtype),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--sizes", default="640x480,1920x1080,4000x3000")
+    args = parser.parse_args()
+
+    current_preprocess = make_current_preprocess()
+    print(f"{'input':<18}{'path':<10}{'median ms':>10}{'p95 ms':>10}{'allocs':>8}{'peak KB':>10}  dtype")
+    for size in args.sizes.split(","):
+        width, height = (int(v) for v in size.split("x"))
+        img = make_drawing(width, height)
+        for ext in (".jpg", ".png"):
+            data = encode(img, ext)
+            for name, fn in (("legacy", legacy_preprocess), ("current", current_preprocess)):
+                r = measure(fn, data, args.repeats)
+                print(
+                    f"{size + ext:<18}{name:<10}{r['median_ms']:>10.2f}{r['p95_ms']:>10.2f}"
+                    f"{r['allocations']:>8}{r['peak_traced_kb']:>10.0f}  {r['output_dtype']}"
+                )
+
+
+if __name__ == "__main__":
+    main()
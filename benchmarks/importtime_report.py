@@ -0,0 +1,83 @@
+"""Report what each page's top-level imports cost on a cold interpreter.
+
+Each page's module-level import statements are replayed in a fresh
+`python -X importtime` process and the self/cumulative times are summed per
+top-level package. Run from the repository root:
+
+    python -m benchmarks.importtime_report
+    python -m benchmarks.importtime_report --json benchmarks/importtime.json
+"""
+import os
+import sys
+import ast
+import json
+import argparse
+import subprocess
+
+PAGES = ["Home.py", "pages/1_Analyze.py", "pages/2_About Drawee.py"]
+
+
+def top_level_imports(path: str) -> list:
+    """Return the source of every module-level import statement in a page"""
+    with open(path, encoding="utf-8") as f:
+        source = f.read()
+    tree = ast.parse(source)
+    return [ast.get_source_segment(source, node) for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+
+
+def run_importtime(snippet: str) -> list:
+    """Return (self_us, cumulative_us, name) for every import made by the snippet"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", snippet],
+        capture_output=True, text=True, cwd=os.getcwd(),
+    )
+    rows = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        rows.append((int(self_us), int(cumulative_us), name[1:].rstrip()))
+    return rows
+
+
+def measure_imports(statements: list) -> dict:
+    """Run the statements under -X importtime and aggregate milliseconds per package"""
+    # Modules the interpreter loads at startup are not the page's cost
+    startup = {name.strip() for _, _, name in run_importtime("pass")}
+
+    # Keep going past imports that need a running app (e.g. st.secrets) so the rest are still measured
+    snippet = "\n".join(f"try:\n    {stmt}\nexcept Exception:\n    pass" for stmt in statements)
+
+    packages = {}
+    total_us = 0
+    for self_us, cumulative_us, name in run_importtime(snippet):
+        if name.strip() in startup:
+            continue
+        total_us += self_us
+        # Only un-indented names are imported directly by the snippet
+        if not name.startswith(" "):
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0) + cumulative_us
+    return {"total_ms": total_us / 1000, "packages_ms": {k: v / 1000 for k, v in sorted(packages.items(), key=lambda kv: -kv[1])}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--json", default="", help="also write the full report to this file")
+    args = parser.parse_args()
+
+    report = {}
+    for page in PAGES:
+        report[page] = measure_imports(top_level_imports(page))
+        print(f"{page}: {report[page]['total_ms']:.0f} ms")
+        for package, ms in list(report[page]["packages_ms"].items())[:args.top]:
+            print(f"    {package:<28}{ms:>10.1f} ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""Drive concurrent simulated users through the app against the in-process fake Supabase.
+
+Each user logs in, selects a child, analyzes drawings and opens the child's
+records, with the Analyze page run through Streamlit's AppTest. Throughput
+and per-step tail latency are reported for every concurrency level:
+
+    python -m benchmarks.load_test --users 1,4,16 --latency-ms "select=15,insert=30,upload=80"
+
+AppTest cannot drive st.file_uploader, so the upload step submits the
+uploaded bytes to the same analysis job the page would start. AppTest swaps
+process-wide state while a script runs, so page runs take turns; the time
+spent waiting for a turn is reported as render_wait and left out of the
+step latencies. Every user at
+every level uploads its own seeded drawings, and the prediction cache and the
+journal are emptied between levels, so each upload pays for inference and
+storage.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import tempfile
+import threading
+
+# Must be set before utils.config is imported
+os.environ["DRAWEE_FAKE_SUPABASE"] = "1"
+os.environ.setdefault("DRAWEE_BCRYPT_ROUNDS", "4")
+os.environ.setdefault("DRAWEE_JOURNAL_PATH", os.path.join(tempfile.mkdtemp(prefix="drawee-load-"), "journal.sqlite3"))
+
+import numpy as np
+
+from benchmarks.bench_analysis import load_model
+from benchmarks.synthetic import sample_uploads
+from utils import fake_supabase, journal
+from utils.cache import prediction_cache
+from utils.passwords import hash_password
+
+PAGE = "pages/1_Analyze.py"
+PASSWORD = "load-test-password"
+STEPS = ("open", "login", "select_child", "upload", "view_records")
+
+# AppTest replaces Runtime._instance and st.secrets for the length of a run
+_apptest_lock = threading.Lock()
+
+
+def seed(database, users: int) -> list:
+    """Create one account with one child per simulated user"""
+    password_hash = hash_password(PASSWORD)
+    accounts = []
+    for idx in range(users):
+        user = {"id": f"00000000-0000-4000-8000-{idx:012d}", "username": f"load-user-{idx}", "password": password_hash}
+        child = {"id": f"00000000-0000-4000-9000-{idx:012d}", "user_id": user["id"], "name": f"Child {idx}"}
+        database.table_rows("users").append(user)
+        database.table_rows("children").append(child)
+        accounts.append((user, child))
+    return accounts
+
+
+def _button(at, label: str):
+    return next(button for button in at.button if button.label == label)
+
+
+def run_user(user: dict, child: dict, uploads: list, timeout: float) -> dict:
+    """Walk one user through the app; returns seconds per step and any error"""
+    from streamlit.testing.v1 import AppTest
+    from utils import analysis
+
+    timings = {}
+    render_wait = 0.0
+
+    def step(name, fn, page=True):
+        nonlocal render_wait
+        waited = time.perf_counter()
+        with _apptest_lock if page else contextlib.nullcontext():
+            start = time.perf_counter()
+            render_wait += start - waited
+            try:
+                fn()
+            except Exception as e:
+                raise RuntimeError(f"{name}: {e}") from e
+            timings[name] = time.perf_counter() - start
+        if page and at.exception:
+            raise RuntimeError(f"{name}: {at.exception[0].message}")
+
+    at = AppTest.from_file(PAGE, default_timeout=timeout)
+    at.secrets["cookie_password"] = "load-test"
+    try:
+        step("open", at.run)
+
+        at.text_input(key="login_username").input(user["username"])
+        at.text_input(key="login_password").input(PASSWORD)
+        step("login", _button(at, "Login").click().run)
+
+        step("select_child", at.selectbox[0].select(child["name"]).run)
+
+        def upload():
+            job_id = analysis.make_job_id(user["id"], child["id"], [str(time.perf_counter_ns())])
+            analysis.submit_job(
+                job_id, analysis.analyze_drawings, uploads, user["id"], child["id"], job_id, user_id=user["id"]
+            ).result(timeout)
+            analysis.forget_job(job_id)
+        step("upload", upload, page=False)
+
+        def view_records():
+            at.query_params["child_id"] = child["id"]
+            at.run()
+        step("view_records", view_records)
+    except Exception as e:
+        return {"timings": timings, "render_wait": render_wait, "error": str(e)}
+    return {"timings": timings, "render_wait": render_wait, "error": None}
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {}
+    p50, p95, p99 = np.percentile(values, [50, 95, 99]) * 1000
+    return {"p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1), "p99_ms": round(float(p99), 1)}
+
+
+def wait_for_journal(timeout: float) -> float:
+    """Wait until the journal has pushed everything; returns the seconds waited"""
+    start = time.perf_counter()
+    while journal.journal_stats()["pending"] and time.perf_counter() - start < timeout:
+        time.sleep(0.05)
+    return time.perf_counter() - start
+
+
+def run_level(users: int, drawings: int, first_seed: int, timeout: float) -> dict:
+    database = fake_supabase.get_database()
+    database.reset()
+    # Nothing from an earlier level may be served from cache or point at objects the reset dropped
+    prediction_cache.clear()
+    journal.clear()
+    accounts = seed(database, users)
+    uploads = [sample_uploads(drawings, first_seed=first_seed + idx * drawings) for idx in range(users)]
+
+    outcomes = [None] * users
+    barrier = threading.Barrier(users)
+
+    def worker(idx):
+        barrier.wait()
+        outcomes[idx] = run_user(*accounts[idx], uploads[idx], timeout)
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(idx,)) for idx in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    drain = wait_for_journal(timeout)
+
+    completed = [o for o in outcomes if o["error"] is None]
+    return {
+        "users": users,
+        "completed": len(completed),
+        "errors": [o["error"] for o in outcomes if o["error"]],
+        "seconds": round(elapsed, 2),
+        "flows_per_second": round(len(completed) / elapsed, 3),
+        "journal_drain_seconds": round(drain, 2),
+        "journal": journal.journal_stats(),
+        "results_rows": len(database.table_rows("results")),
+        "steps": {name: percentiles([o["timings"][name] for o in outcomes if name in o["timings"]]) for name in STEPS},
+        "render_wait": percentiles([o["render_wait"] for o in outcomes]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", default="1,2,4,8", help="concurrency levels to run")
+    parser.add_argument("--latency-ms", default="default=10,upload=40",
+                        help='Supabase delay, "20" or "select=10,upload=80"')
+    parser.add_argument("--drawings", type=int, default=2, help="drawings per upload")
+    parser.add_argument("--timeout", type=float, default=120)
+    parser.add_argument("--json", default="", help="write the report to this file")
+    args = parser.parse_args()
+
+    fake_supabase.get_database().latency = fake_supabase.parse_latency(args.latency_ms)
+    _, stand_in = load_model(stand_in=False)
+
+    report = {"latency_ms": args.latency_ms, "stand_in_model": stand_in, "levels": []}
+    print(f"{'users':>6}{'done':>6}{'flows/s':>10}  " + "".join(f"{name + ' p95':>18}" for name in STEPS))
+    first_seed = 0
+    for users in (int(v) for v in args.users.split(",")):
+        level = run_level(users, args.drawings, first_seed, args.timeout)
+        first_seed += users * args.drawings
+        report["levels"].append(level)
+        print(f"{users:>6}{level['completed']:>6}{level['flows_per_second']:>10.2f}  "
+              + "".join(f"{level['steps'][name].get('p95_ms', float('nan')):>18.1f}" for name in STEPS))
+        for error in level["errors"][:3]:
+            print(f"  error: {error}")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+    if any(level["errors"] for level in report["levels"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Synthetic drawing-like images for benchmarks and offline checks."""
+import cv2
+import numpy as np
+
+
+def make_drawing(width: int, height: int, seed: int = 0) -> np.ndarray:
+    """Draw random crayon-like strokes on a white page"""
+    rng = np.random.default_rng(seed)
+    img = np.full((height, width, 3), 255, dtype=np.uint8)
+    for _ in range(40):
+        pts = rng.integers(0, [width, height], size=(6, 2)).astype(np.int32)
+        color = tuple(int(c) for c in rng.integers(0, 255, size=3))
+        cv2.polylines(img, [pts], False, color, thickness=max(2, width // 200))
+    return img
+
+
+def encode(img: np.ndarray, ext: str) -> bytes:
+    """Encode an RGB array the way an uploaded file would arrive"""
+    ok, buf = cv2.imencode(ext, cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+    assert ok
+    return buf.tobytes()
+
+
+def sample_uploads(count: int, width: int = 1024, height: int = 768, ext: str = ".jpg", first_seed: int = 0) -> list:
+    """Return a fixed, seeded set of encoded drawings"""
+    return [encode(make_drawing(width, height, seed), ext) for seed in range(first_seed, first_seed + count)]
@@ -1,17 +1,9 @@
 import streamlit as st
 st.set_page_config(page_title="Drawee | Analyze", page_icon="🖼️")
 
-import uuid
-import io
-import numpy as np
-import os
-import gdown
-import plotly.graph_objects as go
-import time
-from PIL import Image
-import cv2
-from tensorflow.keras.models import load_model
 from utils.auth import login, signup, is_authenticated, logout, get_supabase_client, get_supabase_admin_client
+from utils.model import ModelUnavailable, start_warm_up
+from utils import cleanup, journal, metrics, repository
 from classes_def import stage_insights, development_tips, recommended_activities, classes
 import Child_Records
 
@@ -20,6 +12,9 @@ if supabase_admin is None:
     st.error("Error: Unable to connect to Supabase.")
     st.stop()
 
+# Identical reads within this run go to Supabase once
+repository.begin_request()
+
 # --- Get query params to detect if showing Child Records or Analyze ---
 # child_id = st.query_params.get("child_id", [None])[0]
 child_id = st.session_state.get("selected_child_id", None)
@@ -106,19 +101,11 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def get_model():
-    file_id = "1_4pP1CIC_DSRa7wHXaTMSjY4nJbR9XO0"
-    output_path = "model_cache/drawee-v1.7.h5"
-
-    # Make sure the directory exists
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-
-    # Download only if the file doesn't already exist
-    if not os.path.exists(output_path):
-        url = f"https://drive.google.com/uc?id={file_id}"
-        gdown.download(url, output_path, quiet=False)
-
-    return load_model(output_path)
+# Load and warm the shared model in the background while the page renders
+start_warm_up()
+metrics.start_exporter()
+# Resume journaled writes left over from before a restart
+journal.start_flusher()
 
 if is_authenticated():
 
@@ -148,8 +135,7 @@ if is_authenticated():
 
         # Fetch existing children names for autocomplete
         user_id = st.session_state['user']['id']
-        children_response = supabase_admin.table("children").select("name").eq("user_id", user_id).execute()
-        existing_children = [c['name'] for c in children_response.data] if children_response.data else []
+        existing_children = [c['name'] for c in repository.list_children(user_id)]
 
         options = ["New Record"] + existing_children
         selected_name = st.selectbox("Select a child or create a new record:", options)
@@ -161,22 +147,13 @@ if is_authenticated():
         child_name = new_child_name.strip() if new_child_name else (selected_name if selected_name != "New Record" else "")
 
         if child_name:
-            child_response = supabase_admin.table("children").select("id").eq("user_id", user_id).eq("name", child_name).execute()
-            if child_response.data:
-                child_id_local = child_response.data[0]['id']
-            else:
-                child_id_local = str(uuid.uuid4())
-                supabase_admin.table("children").insert({
-                    "id": child_id_local,
-                    "user_id": user_id,
-                    "name": child_name
-                }).execute()
+            child_id_local = repository.get_or_create_child(user_id, child_name)
 
             st.session_state['current_child_id'] = child_id_local
             st.session_state['current_child_name'] = child_name
 
-            st.markdown("<h5>📸 Upload the Drawing</h5>", unsafe_allow_html=True)
-            upload = st.file_uploader("", type=["png", "jpg", "jpeg"], key="file_input", label_visibility="collapsed")
+            st.markdown("<h5>📸 Upload the Drawings</h5>", unsafe_allow_html=True)
+            uploads = st.file_uploader("", type=["png", "jpg", "jpeg"], key="file_input", label_visibility="collapsed", accept_multiple_files=True)
 
             # @st.cache_resource
             # def get_model():
@@ -186,62 +163,48 @@ if is_authenticated():
             #     # return load_model("drawee-v1.6.2.h5") # puro scribbling sya 100%
             #     return load_model("drawee-v1.7.h5")
 
-            if upload:
-                im = Image.open(upload).convert("RGB")
-                img = np.asarray(im)
-
-                # v.1.6+ (ResNet50 Model)
-                # resized_img = cv2.resize(img, (182, 183)) / 255.0
-                # image = resized_img.reshape(1, -1)  # Flatten image to 1D vector
-
-                # # If needed, crop or pad to 100,352
-                # expected_size = 100352
-
-                # if image.shape[1] > expected_size:
-                #     # Crop extra features
-                #     image = image[:, :expected_size]
-                # elif image.shape[1] < expected_size:
-                #     # Pad with zeros
-                #     padding = expected_size - image.shape[1]
-                #     image = np.pad(image, ((0, 0), (0, padding)), mode='constant')
-
+            if uploads:
+                # NumPy, OpenCV and the model stack load only once there is something to analyze
+                from utils import analysis
+
+                job_id = analysis.make_job_id(user_id, child_id_local, [upload.file_id for upload in uploads])
+
+                # A rerun for the same uploads reuses the queued job instead of starting another
+                previous_job_id = st.session_state.get('analysis_job_id')
+                if previous_job_id and previous_job_id != job_id:
+                    analysis.forget_job(previous_job_id)
+                st.session_state['analysis_job_id'] = job_id
+
+                busy = None
+                if analysis.get_job(job_id) is None:
+                    # v.7 (Xception Model): decoding, resizing and the batched predict run in the worker
+                    try:
+                        analysis.submit_job(
+                            job_id, analysis.analyze_drawings,
+                            [upload.getvalue() for upload in uploads], user_id, child_id_local, job_id,
+                            [upload.name for upload in uploads], user_id=user_id
+                        )
+                    except analysis.AnalysisBusy as e:
+                        busy = e
+
+                @st.fragment(run_every=0.5)
+                def wait_for_result():
+                    job = analysis.get_job(job_id)
+                    if job is None or job.done():
+                        st.rerun()
+                    st.markdown(f"⏳ Analyzing {len(uploads)} drawing(s)...")
 
-                # v.7 (Xception Model)
-                resized_img = cv2.resize(img, (256, 256))
-                resized_img = resized_img / 255.0
-                image = np.expand_dims(resized_img, axis=0)
+                def show_result(result, upload):
+                    import plotly.graph_objects as go
 
-                @st.dialog("🎯 Analysis Result")
-                def show_result_dialog():
-                    with st.spinner("Analyzing your drawing..."):
-                        time.sleep(2)
-                        model = get_model()
-                        preds = model.predict(image)
-                        percentages = preds[0]
-                        pred_class = np.argmax(percentages)
-                        stage_name = classes[pred_class]
-                        confidence = percentages[pred_class] * 100
-
-                        image_bytes = io.BytesIO()
-                        im.save(image_bytes, format='PNG')
-                        image_bytes = image_bytes.getvalue()
-                        filename = f"{uuid.uuid4().hex}.png"
-                        storage_path = f"user_uploads/{filename}"
-
-                        supabase_admin.storage.from_("drawings").upload(storage_path, image_bytes)
-                        image_url = supabase_admin.storage.from_("drawings").get_public_url(storage_path)
-
-                        supabase_admin.table("results").insert({
-                            "user_id": user_id,
-                            "child_id": child_id_local,
-                            "image_path": image_url,
-                            "prediction": stage_name,
-                            "confidence": float(confidence)
-                        }).execute()
+                    percentages = result["percentages"]
+                    pred_class = result["pred_class"]
+                    stage_name = result["stage_name"]
+                    confidence = result["confidence"]
 
                     st.markdown(f"**{stage_name}** - {stage_insights[stage_name]}")
                     st.markdown(f"Confidence: **{confidence:.2f}%**")
-                    st.image(im, caption='Uploaded Drawing', use_container_width=True)
+                    st.image(upload, caption='Uploaded Drawing', use_container_width=True)
 
                     fig = go.Figure(go.Bar(
                         x=percentages * 100,
@@ -251,7 +214,7 @@ if is_authenticated():
                         textposition='outside',
                         marker=dict(color=['#ff6666' if i == pred_class else '#ffcccc' for i in range(len(classes))])
                     ))
-                    st.plotly_chart(fig, use_container_width=True)
+                    st.plotly_chart(fig, use_container_width=True, key=f"chart_{upload.file_id}")
 
                     st.subheader("Development Tips")
                     for tip in development_tips[stage_name]:
@@ -260,6 +223,49 @@ if is_authenticated():
                     for activity in recommended_activities[stage_name]:
                         st.markdown(f"- {activity}")
 
+                @st.dialog("🎯 Analysis Result")
+                def show_result_dialog():
+                    if busy is not None:
+                        st.warning(f"⏳ {busy}")
+                        if st.button("Retry", use_container_width=True):
+                            st.rerun()
+                        return
+
+                    job = analysis.get_job(job_id)
+                    if job is None:
+                        st.warning("This analysis has expired. Please upload the drawings again.")
+                        return
+                    if not job.done():
+                        wait_for_result()
+                        return
+
+                    try:
+                        results = job.result()
+                    except ModelUnavailable as e:
+                        st.warning(f"⏳ {e}")
+                        if st.button("Retry", use_container_width=True):
+                            # Drop the failed job so the rerun submits it again
+                            analysis.forget_job(job_id)
+                            st.rerun()
+                        return
+                    except Exception as e:
+                        st.error(f"Analysis failed: {e}")
+                        return
+
+                    # Unreadable files are reported by name; the other drawings were still analyzed
+                    for result in results:
+                        if "error" in result:
+                            st.error(f"Could not analyze {result['name']}: {result['error']}")
+                    analyzed = [(result, upload) for result, upload in zip(results, uploads) if "error" not in result]
+
+                    if len(analyzed) == 1:
+                        show_result(*analyzed[0])
+                        return
+
+                    for idx, (result, upload) in enumerate(analyzed):
+                        with st.expander(f"{upload.name}: {result['stage_name']} ({result['confidence']:.1f}%)", expanded=idx == 0):
+                            show_result(result, upload)
+
                 show_result_dialog()
 
         st.markdown("---")
@@ -314,22 +320,21 @@ if is_authenticated():
         st.markdown("<h5>List of Children's Drawings Analyzed</h5>", unsafe_allow_html=True)
 
         try:
-            # Fetch children from Supabase
-            child_list = supabase_admin.table("children").select("id, name").eq("user_id", user_id).execute()
+            # Fetch children with their record counts in one query
+            child_list = repository.get_children_summary(user_id)
 
             # Handle delete via query param
             delete_child_id = st.query_params.get("delete_child_id")
             if delete_child_id:
                 try:
-                    supabase_admin.table("results").delete().eq("child_id", delete_child_id).execute()
-                    supabase_admin.table("children").delete().eq("id", delete_child_id).execute()
-                    st.success("Child and associated records deleted successfully.")
+                    if cleanup.delete_child(user_id, delete_child_id):
+                        st.success("Child and associated records deleted successfully.")
                     st.query_params.clear()  # Clear query params
                     st.rerun()
                 except Exception as e:
                     st.error(f"Failed to delete child: {e}")
 
-            if not child_list.data:
+            if not child_list:
                 st.info("No child records found yet.")
             else:
                 # Header row
@@ -347,8 +352,9 @@ if is_authenticated():
                     st.query_params.clear()
                     st.rerun()
 
-                for idx, child in enumerate(child_list.data):
-                    result_count = supabase_admin.table("results").select("id", count="exact").eq("child_id", child['id']).execute().count or 0
+                for idx, child in enumerate(child_list):
+                    result_count = child['record_count'] or 0
+                    last_analyzed = Child_Records.format_created_at(child['last_analyzed_at'], "%b %d, %Y") if child['last_analyzed_at'] else "Not analyzed yet"
                     view_url = f"?child_id={child['id']}"
                     delete_form = f"""
                         <form method="get" style="margin: 0;" onsubmit="return confirm('Are you sure you want to delete this child and all associated records?');">
@@ -380,7 +386,7 @@ if is_authenticated():
                             font-size: 13px;
                         ">
                             <div style="flex: 3; font-weight: bold;">{child['name']}</div>
-                            <div style="flex: 2; color: #888;">{result_count} record(s)</div>
+                            <div style="flex: 2; color: #888;">{result_count} record(s)<br/><small>Last: {last_analyzed}</small></div>
                             <div style="flex: 2; display: flex; gap: 0.5rem;">
                                 <a href="{view_url}" style="
                                     flex: 1;
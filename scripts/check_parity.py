@@ -0,0 +1,55 @@
+"""Report top-1 agreement between the Keras model and a converted backend.
+
+Run from the repository root on a fixed sample set:
+
+    python -m scripts.check_parity --backend tflite --samples samples/
+"""
+import sys
+import json
+import argparse
+
+import numpy as np
+
+from scripts.convert_model import load_calibration_batch
+from utils.backends import create_backend
+from utils.model import BACKEND_PATHS
+
+
+def predict_all(backend, images: np.ndarray, batch_size: int) -> np.ndarray:
+    return np.concatenate([
+        backend.predict(images[start:start + batch_size])
+        for start in range(0, len(images), batch_size)
+    ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backend", choices=["tflite", "onnx"], required=True)
+    parser.add_argument("--path", default="", help="artifact to check; defaults to the backend's path")
+    parser.add_argument("--samples", default="", help="folder of drawings; seeded synthetic drawings if empty")
+    parser.add_argument("--count", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--min-agreement", type=float, default=0.0, help="exit non-zero below this rate")
+    args = parser.parse_args()
+
+    images = load_calibration_batch(args.samples, args.count)
+    reference = create_backend("keras", BACKEND_PATHS["keras"]).load()
+    candidate = create_backend(args.backend, args.path or BACKEND_PATHS[args.backend]).load()
+
+    expected = predict_all(reference, images, args.batch_size)
+    actual = predict_all(candidate, images, args.batch_size)
+    agreement = float(np.mean(expected.argmax(axis=1) == actual.argmax(axis=1)))
+
+    print(json.dumps({
+        "backend": args.backend,
+        "samples": len(images),
+        "top1_agreement": agreement,
+        "max_abs_prob_diff": float(np.abs(expected - actual).max()),
+        "mean_abs_prob_diff": float(np.abs(expected - actual).mean()),
+    }, indent=2))
+    if agreement < args.min_agreement:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Convert the Keras .h5 model into a quantized TFLite or ONNX artifact.
+
+Run from the repository root, then set DRAWEE_MODEL_BACKEND to serve it:
+
+    python -m scripts.convert_model --format tflite --quantize float16
+    python -m scripts.convert_model --format tflite --quantize int8 --calibration-dir samples/
+    python -m scripts.convert_model --format onnx --quantize int8
+"""
+import os
+import glob
+import argparse
+
+import numpy as np
+
+from benchmarks.synthetic import sample_uploads
+from utils.model import BACKEND_PATHS, MODEL_PATH
+from utils.preprocess import allocate_batch, decode_image, preprocess_into
+
+
+def load_calibration_batch(calibration_dir: str, count: int) -> np.ndarray:
+    """Preprocess real drawings from a folder, or seeded synthetic ones if none is given"""
+    if calibration_dir:
+        paths = sorted(glob.glob(os.path.join(calibration_dir, "*")))[:count]
+        uploads = [open(path, "rb").read() for path in paths]
+    else:
+        uploads = sample_uploads(count)
+
+    images = allocate_batch(len(uploads))
+    for idx, data in enumerate(uploads):
+        preprocess_into(decode_image(data), images[idx])
+    return images
+
+
+def convert_tflite(model, output_path: str, quantize: str, calibration: np.ndarray):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize != "none":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantize == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        # Full-integer weights and activations; input and output stay float32
+        converter.representative_dataset = lambda: ([image[np.newaxis]] for image in calibration)
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def convert_onnx(model, output_path: str, quantize: str):
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = [tf.TensorSpec((None, 256, 256, 3), tf.float32, name="input")]
+    if quantize == "none":
+        tf2onnx.convert.from_keras(model, input_signature=spec, output_path=output_path)
+        return
+
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    fp32_path = f"{output_path}.fp32"
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=fp32_path)
+    if quantize == "float16":
+        import onnx
+        from onnxconverter_common import float16
+
+        onnx.save(float16.convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True), output_path)
+    else:
+        quantize_dynamic(fp32_path, output_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--format", choices=["tflite", "onnx"], default="tflite")
+    parser.add_argument("--quantize", choices=["none", "float16", "int8"], default="float16")
+    parser.add_argument("--source", default=MODEL_PATH)
+    parser.add_argument("--output", default="")
+    parser.add_argument("--calibration-dir", default="", help="drawings used to calibrate int8 ranges")
+    parser.add_argument("--calibration-count", type=int, default=100)
+    args = parser.parse_args()
+
+    from tensorflow.keras.models import load_model
+
+    model = load_model(args.source)
+    output_path = args.output or BACKEND_PATHS[args.format]
+
+    if args.format == "tflite":
+        calibration = load_calibration_batch(args.calibration_dir, args.calibration_count) if args.quantize == "int8" else None
+        convert_tflite(model, output_path, args.quantize, calibration)
+    else:
+        convert_onnx(model, output_path, args.quantize)
+
+    print(f"Wrote {output_path} ({os.path.getsize(output_path) / (1024 * 1024):.1f} MB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+-- One row per child with its record count and latest analysis, so the
+-- Analyze page can list children without a count query per child.
+create or replace view public.children_summary as
+select
+    c.id,
+    c.user_id,
+    c.name,
+    count(r.id) as record_count,
+    max(r.created_at) as last_analyzed_at
+from public.children c
+left join public.results r on r.child_id = c.id
+group by c.id, c.user_id, c.name;
+
+create index if not exists results_child_id_idx on public.results (child_id);
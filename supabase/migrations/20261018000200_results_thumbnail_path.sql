@@ -0,0 +1,3 @@
+-- Public URL of the 256 px WebP thumbnail stored next to each drawing.
+-- Older rows keep a null thumbnail and fall back to image_path.
+alter table public.results add column if not exists thumbnail_path text;
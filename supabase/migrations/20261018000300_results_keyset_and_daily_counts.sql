@@ -0,0 +1,14 @@
+-- Keyset pagination of a child's history on (created_at, id), newest first.
+create index if not exists results_child_created_id_idx
+    on public.results (child_id, created_at desc, id desc);
+
+-- Drawings per child, day (Asia/Manila) and predicted stage, for the
+-- Child_Records summary and timeline chart.
+create or replace view public.child_daily_stage_counts as
+select
+    child_id,
+    (created_at at time zone 'Asia/Manila')::date as created_date,
+    prediction,
+    count(*) as count
+from public.results
+group by child_id, (created_at at time zone 'Asia/Manila')::date, prediction;
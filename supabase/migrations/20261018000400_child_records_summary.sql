@@ -0,0 +1,29 @@
+-- Everything the Child_Records summary and timeline need for one child in
+-- a single small JSON document: total, counts per stage, the most common
+-- stage, and counts per Asia/Manila day and stage.
+create or replace function public.child_records_summary(p_child_id uuid)
+returns json
+language sql
+stable
+as $$
+    with stage_counts as (
+        select prediction, count(*) as count
+        from public.results
+        where child_id = p_child_id
+        group by prediction
+    )
+    select json_build_object(
+        'total', coalesce((select sum(count) from stage_counts), 0),
+        'stage_counts', coalesce(
+            (select json_agg(json_build_object('prediction', prediction, 'count', count) order by count desc, prediction)
+             from stage_counts),
+            '[]'::json),
+        'most_common', (select prediction from stage_counts order by count desc, prediction limit 1),
+        'daily', coalesce(
+            (select json_agg(json_build_object('created_date', created_date, 'prediction', prediction, 'count', count)
+                             order by created_date, prediction)
+             from public.child_daily_stage_counts
+             where child_id = p_child_id),
+            '[]'::json)
+    );
+$$;
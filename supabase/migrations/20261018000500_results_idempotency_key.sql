@@ -0,0 +1,4 @@
+-- Set by the write-behind journal so a replayed insert cannot create a
+-- duplicate result. Older rows keep a null key.
+alter table public.results add column if not exists idempotency_key text;
+create unique index if not exists results_idempotency_key_idx on public.results (idempotency_key);
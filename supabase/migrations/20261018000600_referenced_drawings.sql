@@ -0,0 +1,13 @@
+-- Lets the storage cleanup ask which drawings are still used by any result
+-- in one request, however many URLs it is checking.
+create index if not exists results_image_path_idx on public.results (image_path);
+
+create or replace function public.referenced_drawings(p_image_paths text[])
+returns table (image_path text)
+language sql
+stable
+as $$
+    select distinct r.image_path
+    from public.results r
+    where r.image_path = any(p_image_paths);
+$$;
@@ -0,0 +1,20 @@
+-- Match drawings on the content hash in their storage path instead of the
+-- full public URL, which changes with the project URL, a custom domain or
+-- the storage client's URL format. A mismatch would make every drawing look
+-- orphaned to the storage cleanup.
+alter table public.results
+    add column if not exists image_digest text
+    generated always as (substring(image_path from 'user_uploads/([^/?._]+)')) stored;
+create index if not exists results_image_digest_idx on public.results (image_digest);
+drop index if exists public.results_image_path_idx;
+
+drop function if exists public.referenced_drawings(text[]);
+create function public.referenced_drawings(p_digests text[])
+returns table (digest text)
+language sql
+stable
+as $$
+    select distinct r.image_digest
+    from public.results r
+    where r.image_digest = any(p_digests);
+$$;
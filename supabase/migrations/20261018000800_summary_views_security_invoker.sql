@@ -0,0 +1,10 @@
+-- Views run with their owner's privileges unless told otherwise, which
+-- bypasses row level security on children and results and would let the
+-- anon key read every user's children through PostgREST. Check RLS as the
+-- caller instead, and keep the views to the service role the app reads
+-- them with.
+alter view public.children_summary set (security_invoker = true);
+alter view public.child_daily_stage_counts set (security_invoker = true);
+
+revoke all on public.children_summary from anon, authenticated;
+revoke all on public.child_daily_stage_counts from anon, authenticated;
@@ -0,0 +1,308 @@
+import math
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+
+from classes_def import classes
+from utils.auth import get_supabase_admin_client
+from utils.cache import content_hash, prediction_cache, prediction_key
+from utils.cleanup import drawing_paths
+from utils.inference_server import predict_remote
+from utils.batcher import get_batcher
+from utils.config import ANALYSIS_WORKERS, ANALYSIS_QUEUE_SIZE, ANALYSIS_JOBS_PER_USER, PREPROCESS_WORKERS, PREDICT_BATCH_SIZE, THUMBNAIL_SIZES, MICROBATCH_MAX_WAIT_MS, INFERENCE_URL
+from utils import journal, metrics
+from utils.model import get_model
+from utils.preprocess import allocate_batch, decode_image, encode_png, make_thumbnail, preprocess_into
+
+MAX_TRACKED_JOBS = 256
+
+# Shared by every session in the process; jobs are keyed so reruns can find them again
+_executor = ThreadPoolExecutor(max_workers=ANALYSIS_WORKERS, thread_name_prefix="drawee-analysis")
+_preprocess_executor = ThreadPoolExecutor(max_workers=PREPROCESS_WORKERS, thread_name_prefix="drawee-preprocess")
+_jobs = OrderedDict()
+# Reentrant: a job that finishes before its done-callback is added runs the callback under the lock
+_jobs_lock = threading.RLock()
+# Admission control: unfinished jobs in total and per user, and a running mean of job time
+_active_jobs = 0
+_active_by_user = {}
+_mean_job_seconds = 5.0
+
+
+class AnalysisBusy(Exception):
+    """Raised when an analysis is turned away instead of queued"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def make_job_id(user_id, child_id, upload_ids) -> str:
+    """Build a stable job id so the same uploads for the same child are analyzed once"""
+    return f"{user_id}:{child_id}:{','.join(sorted(upload_ids))}"
+
+
+def predict_batch(images: np.ndarray, batch_size: int = PREDICT_BATCH_SIZE) -> np.ndarray:
+    """Classify an (N, 256, 256, 3) float32 batch, one forward pass per chunk"""
+    if INFERENCE_URL:
+        with metrics.span("predict", len(images)):
+            probs = predict_remote(images)
+        if probs is not None:
+            return probs
+
+    if MICROBATCH_MAX_WAIT_MS > 0:
+        # Shared with every other session's predictions; see utils/batcher.py
+        with metrics.span("predict", len(images)):
+            return get_batcher().predict(images)
+
+    model = get_model()
+    preds = []
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        with metrics.span("predict", len(chunk)):
+            preds.append(model.predict(chunk))
+    return np.concatenate(preds, axis=0)
+
+
+def upload_keys(digest: str) -> list:
+    """Journal keys of the stored drawing and thumbnails for a content hash"""
+    return [f"upload:{path}" for path in drawing_paths(digest)]
+
+
+def _store_drawing(img: np.ndarray, digest: str, batch_size: int) -> dict:
+    """Journal a drawing and its thumbnails for upload and return their public URLs"""
+    bucket = get_supabase_admin_client().storage.from_("drawings")
+
+    # Content-addressed, so re-uploading the same photo maps to the same objects
+    storage_path = f"user_uploads/{digest}.png"
+    with metrics.span("encode_png", batch_size):
+        png = encode_png(img)
+    journal.enqueue_upload(f"upload:{storage_path}", storage_path, png, "image/png")
+
+    thumbnail_urls = []
+    for size in THUMBNAIL_SIZES:
+        thumbnail_path = f"user_uploads/{digest}_{size}.webp"
+        with metrics.span("thumbnail", batch_size):
+            thumbnail = make_thumbnail(img, size)
+        journal.enqueue_upload(f"upload:{thumbnail_path}", thumbnail_path, thumbnail, "image/webp")
+        thumbnail_urls.append(bucket.get_public_url(thumbnail_path))
+
+    return {
+        "image_url": bucket.get_public_url(storage_path),
+        "thumbnail_url": thumbnail_urls[0] if thumbnail_urls else None,
+    }
+
+
+def _analyze_new_drawings(uploads: dict) -> dict:
+    """Decode, classify and store drawings that are not in the cache, keyed by content hash
+
+    A drawing that cannot be decoded gets an {"error": ...} entry instead of
+    failing the others.
+    """
+    digests = list(uploads)
+    images = allocate_batch(len(digests))
+    batch_size = len(digests)
+
+    def preprocess(idx, data):
+        try:
+            with metrics.span("decode", batch_size):
+                img = decode_image(data)
+        except (ValueError, cv2.error) as e:
+            return e
+        with metrics.span("preprocess", batch_size):
+            preprocess_into(img, images[idx])
+        return img
+
+    decoded = list(_preprocess_executor.map(preprocess, range(len(digests)), uploads.values()))
+    entries = {digest: {"error": str(img)} for digest, img in zip(digests, decoded) if isinstance(img, Exception)}
+    ok = [idx for idx, img in enumerate(decoded) if not isinstance(img, Exception)]
+    if not ok:
+        return entries
+    if len(ok) < len(digests):
+        images = images[ok]
+        digests = [digests[idx] for idx in ok]
+        decoded = [decoded[idx] for idx in ok]
+
+    preds = predict_batch(images)
+
+    stored = _preprocess_executor.map(lambda img, digest: _store_drawing(img, digest, batch_size), decoded, digests)
+
+    for digest, percentages, urls in zip(digests, preds, stored):
+        entries[digest] = {"percentages": percentages, **urls}
+        prediction_cache.put(prediction_key(digest), entries[digest])
+    return entries
+
+
+def analyze_drawings(uploads, user_id, child_id, job_id: str, names: list = None) -> list:
+    """Classify a list of uploaded drawings, store them and record all results in one insert
+
+    The results rows are keyed by job_id, so running the same job again
+    records nothing new. A drawing that cannot be read comes back as
+    {"name": ..., "error": ...} and the rest are still analyzed and stored.
+    """
+    with metrics.span("analysis", len(uploads)):
+        return _analyze_drawings(uploads, user_id, child_id, job_id, names)
+
+
+def _analyze_drawings(uploads, user_id, child_id, job_id: str, names: list = None) -> list:
+    names = names or [f"Drawing {idx + 1}" for idx in range(len(uploads))]
+    batch_size = len(uploads)
+    with metrics.span("hash", batch_size):
+        digests = [content_hash(data) for data in uploads]
+
+    # Repeat uploads skip inference and the storage write entirely
+    entries = {}
+    new_uploads = {}
+    with metrics.span("cache_lookup", batch_size):
+        for digest, data in zip(digests, uploads):
+            if digest in entries or digest in new_uploads:
+                continue
+            cached = prediction_cache.get(prediction_key(digest))
+            if cached is not None and journal.missing(upload_keys(digest)):
+                # Its drawing was removed, possibly by a process whose cache this is not
+                prediction_cache.discard(prediction_key(digest))
+                cached = None
+            if cached is not None:
+                entries[digest] = cached
+            else:
+                new_uploads[digest] = data
+
+    if new_uploads:
+        entries.update(_analyze_new_drawings(new_uploads))
+
+    results = []
+    for digest, name in zip(digests, names):
+        if "error" in entries[digest]:
+            results.append({"name": name, "error": entries[digest]["error"]})
+            continue
+        percentages = entries[digest]["percentages"]
+        pred_class = int(np.argmax(percentages))
+        results.append({
+            "percentages": percentages,
+            "pred_class": pred_class,
+            "stage_name": classes[pred_class],
+            "confidence": float(percentages[pred_class] * 100),
+            "image_url": entries[digest]["image_url"],
+            "thumbnail_url": entries[digest].get("thumbnail_url"),
+        })
+
+    stored = [(idx, result) for idx, result in enumerate(results) if "error" not in result]
+    if not stored:
+        return results
+
+    # Shown to the user right away; the journal stores the drawings and rows in the background
+    # Derived from the job, so a resubmitted job (after it was forgotten or a restart) inserts nothing twice
+    batch_key = hashlib.sha256(job_id.encode()).hexdigest()[:32]
+    with metrics.span("journal_results", batch_size):
+        journal.enqueue_results(f"results:{batch_key}", user_id, child_id, [
+            {
+                "image_path": result["image_url"],
+                "thumbnail_path": result["thumbnail_url"],
+                "prediction": result["stage_name"],
+                "confidence": result["confidence"],
+                "idempotency_key": f"{batch_key}:{idx}"
+            }
+            for idx, result in stored
+        ], requires=[key for digest in set(digests) if "error" not in entries[digest] for key in upload_keys(digest)])
+
+    return results
+
+
+def _run_job(submitted: float, fn, *args):
+    global _mean_job_seconds
+    started = time.perf_counter()
+    # Time a job spent waiting for a free analysis worker
+    metrics.stage_histogram("queue_wait").observe(started - submitted)
+    try:
+        return fn(*args)
+    finally:
+        with _jobs_lock:
+            _mean_job_seconds = 0.8 * _mean_job_seconds + 0.2 * (time.perf_counter() - started)
+
+
+def _retry_after(jobs_ahead: int) -> int:
+    """Seconds until a worker is likely free for a job with jobs_ahead in front of it"""
+    return max(1, math.ceil(_mean_job_seconds * jobs_ahead / ANALYSIS_WORKERS))
+
+
+def _shed(reason: str, message: str, retry_after: int):
+    metrics.counter("drawee_analysis_shed_total", reason=reason).inc()
+    raise AnalysisBusy(message.format(seconds=retry_after), retry_after)
+
+
+def _job_finished(user_id):
+    global _active_jobs
+    with _jobs_lock:
+        _active_jobs -= 1
+        if user_id is not None:
+            _active_by_user[user_id] -= 1
+            if not _active_by_user[user_id]:
+                del _active_by_user[user_id]
+        metrics.gauge("drawee_analysis_active_jobs").set(_active_jobs)
+
+
+def submit_job(job_id: str, fn, *args, user_id=None):
+    """Queue fn on the worker pool unless a job with this id already exists
+
+    Raises AnalysisBusy instead of queueing when the queue is full or the
+    user already has ANALYSIS_JOBS_PER_USER analyses unfinished.
+    """
+    global _active_jobs
+    with _jobs_lock:
+        future = _jobs.get(job_id)
+        if future is not None:
+            _jobs.move_to_end(job_id)
+            return future
+
+        # Fail fast rather than let every session pile onto the CPU and time out together
+        if user_id is not None and _active_by_user.get(user_id, 0) >= ANALYSIS_JOBS_PER_USER:
+            _shed("user_busy", "Your previous analysis is still running. Please retry in {seconds} seconds.",
+                  _retry_after(ANALYSIS_WORKERS))
+        if _active_jobs >= ANALYSIS_WORKERS + ANALYSIS_QUEUE_SIZE:
+            _shed("queue_full", "Drawee is busy right now. Please retry in {seconds} seconds.",
+                  _retry_after(_active_jobs - ANALYSIS_WORKERS + 1))
+
+        _active_jobs += 1
+        if user_id is not None:
+            _active_by_user[user_id] = _active_by_user.get(user_id, 0) + 1
+        metrics.gauge("drawee_analysis_active_jobs").set(_active_jobs)
+
+        future = _executor.submit(_run_job, time.perf_counter(), fn, *args)
+        future.add_done_callback(lambda _: _job_finished(user_id))
+        _jobs[job_id] = future
+
+        # Forget the oldest finished jobs so abandoned sessions don't leak results
+        while len(_jobs) > MAX_TRACKED_JOBS:
+            oldest_id, oldest = next(iter(_jobs.items()))
+            if not oldest.done():
+                break
+            _jobs.pop(oldest_id)
+        return future
+
+
+def get_admission_stats() -> dict:
+    """Return unfinished jobs, users with a job running, the queue bound and the mean job time"""
+    with _jobs_lock:
+        return {
+            "active_jobs": _active_jobs,
+            "active_users": len(_active_by_user),
+            "max_jobs": ANALYSIS_WORKERS + ANALYSIS_QUEUE_SIZE,
+            "jobs_per_user": ANALYSIS_JOBS_PER_USER,
+            "mean_job_seconds": _mean_job_seconds,
+        }
+
+
+def get_job(job_id: str):
+    """Return the future for a job, or None if it is unknown"""
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def forget_job(job_id: str):
+    """Drop a job from the registry once its session no longer needs it"""
+    with _jobs_lock:
+        _jobs.pop(job_id, None)
@@ -1,47 +1,109 @@
 import streamlit as st
-import bcrypt
-from supabase import create_client
+import hmac
+import json
+import time
+import base64
+import hashlib
 from streamlit_cookies_manager import EncryptedCookieManager
+from utils.config import FAKE_SUPABASE, SESSION_TTL, SESSION_REVALIDATE_TTL
+from utils.passwords import PasswordPoolBusy, check_password, hash_password
+from utils.supabase_client import create_supabase_client
+from utils import repository
 
-# Load Supabase credentials from secrets.toml
-supabase_url = st.secrets["connections"]["supabase"]["SUPABASE_URL"]
-supabase_anon_key = st.secrets["connections"]["supabase"]["SUPABASE_ANON_KEY"]
-supabase_service_key = st.secrets["connections"]["supabase"]["SUPABASE_SERVICE_ROLE_KEY"]
-cookie_secret = st.secrets["cookie_password"]
+if FAKE_SUPABASE:
+    # In-process stand-in for load tests; the cookie component cannot load without a browser
+    from utils.fake_supabase import SessionCookies, create_fake_client
 
-# Initialize Supabase clients
-supabase = create_client(supabase_url, supabase_anon_key)
-supabase_admin = create_client(supabase_url, supabase_service_key)
+    supabase = supabase_admin = create_fake_client()
+    try:
+        cookie_secret = st.secrets.get("cookie_password", "drawee-fake-supabase")
+    except FileNotFoundError:
+        # No secrets.toml is needed to load test
+        cookie_secret = "drawee-fake-supabase"
+    cookies = SessionCookies()
+else:
+    # Load Supabase credentials from secrets.toml
+    supabase_url = st.secrets["connections"]["supabase"]["SUPABASE_URL"]
+    supabase_anon_key = st.secrets["connections"]["supabase"]["SUPABASE_ANON_KEY"]
+    supabase_service_key = st.secrets["connections"]["supabase"]["SUPABASE_SERVICE_ROLE_KEY"]
+    cookie_secret = st.secrets["cookie_password"]
+
+    # Initialize Supabase clients (pooled, with timeouts, retries and latency metrics)
+    supabase = create_supabase_client(supabase_url, supabase_anon_key)
+    supabase_admin = create_supabase_client(supabase_url, supabase_service_key)
+
+    # Initialize EncryptedCookieManager
+    cookies = EncryptedCookieManager(prefix="drawee", password=cookie_secret)
+
+    if not cookies.ready():
+        st.stop()  # Wait for cookies to initialize
+
+# Separate key so session signatures can't be confused with the cookie encryption
+_session_key = hashlib.sha256(b"drawee-session:" + cookie_secret.encode()).digest()
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+def create_session_token(user_id, username: str, validated_at: float = None) -> str:
+    """Sign the minimal user claims with an expiry and the time they were last checked"""
+    now = time.time()
+    claims = {
+        "id": user_id,
+        "username": username,
+        "exp": int(now + SESSION_TTL),
+        "val": int(validated_at or now),
+    }
+    payload = _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+    signature = _b64encode(hmac.new(_session_key, payload.encode(), hashlib.sha256).digest())
+    return f"{payload}.{signature}"
 
-# Initialize EncryptedCookieManager
-cookies = EncryptedCookieManager(prefix="drawee", password=cookie_secret)
+def verify_session_token(token: str):
+    """Return the claims of a validly signed, unexpired token, else None"""
+    try:
+        payload, signature = token.split(".")
+        expected = _b64encode(hmac.new(_session_key, payload.encode(), hashlib.sha256).digest())
+        if not hmac.compare_digest(signature, expected):
+            return None
+        claims = json.loads(_b64decode(payload))
+    except (ValueError, TypeError):
+        return None
+    if not isinstance(claims, dict) or not {"id", "username", "exp", "val"} <= claims.keys():
+        return None
+    if claims["exp"] < time.time():
+        return None
+    return claims
+
+def _start_session(user_id, username: str, validated_at: float = None):
+    # Only the claims the pages need; the password hash never enters session state
+    st.session_state["user"] = {"id": user_id, "username": username}
+    cookies["session"] = create_session_token(user_id, username, validated_at)
 
-if not cookies.ready():
-    st.stop()  # Wait for cookies to initialize
 
 def login(username: str, password: str) -> bool:
     """Authenticate user and store session and cookie if successful"""
     try:
-        response = supabase.table("users").select("*").eq("username", username).execute()
-        if response.data:
-            user = response.data[0]
-            if bcrypt.checkpw(password.encode(), user["password"].encode()):
-                st.session_state["user"] = user
-                cookies["username"] = user["username"]  # Store cookie for session persistence
+        user = repository.find_user(username, "id, username, password")
+        if user:
+            if check_password(password, user["password"]):
+                _start_session(user["id"], user["username"])  # Signed cookie for session persistence
                 return True
+    except PasswordPoolBusy as e:
+        st.warning(str(e))
     except Exception as e:
         st.error(f"Login failed: {e}")
     return False
 
 def signup(username: str, password: str) -> bool:
     """Create a new user account with hashed password"""
-    hashed_pw = bcrypt.hashpw(password.encode(), bcrypt.gensalt()).decode()
     try:
-        response = supabase.table("users").insert({
-            "username": username,
-            "password": hashed_pw
-        }).execute()
-        return response.data is not None
+        hashed_pw = hash_password(password)
+        return repository.create_user(username, hashed_pw)
+    except PasswordPoolBusy as e:
+        st.warning(str(e))
+        return False
     except Exception as e:
         st.error(f"Signup failed: {e}")
         return False
@@ -49,17 +111,32 @@ def signup(username: str, password: str) -> bool:
 def logout():
     """Clear user session and remove cookies"""
     st.session_state.pop("user", None)
+    cookies["session"] = ""
     cookies["username"] = ""
 
 def is_authenticated() -> bool:
-    """Check if user is logged in, restore session from cookie if possible"""
+    """Check if user is logged in, restore session from the signed cookie if possible"""
     if "user" in st.session_state:
         return True
-    elif "username" in cookies and cookies["username"]:
-        username = cookies["username"]
-        response = supabase.table("users").select("*").eq("username", username).execute()
-        if response.data:
-            st.session_state["user"] = response.data[0]
+
+    claims = verify_session_token(cookies.get("session") or "")
+    if claims:
+        # Trust the signature until the TTL runs out, then confirm the account still exists
+        if time.time() - claims["val"] < SESSION_REVALIDATE_TTL:
+            st.session_state["user"] = {"id": claims["id"], "username": claims["username"]}
+            return True
+        if repository.user_exists(claims["id"], claims["username"]):
+            _start_session(claims["id"], claims["username"])
+            return True
+        logout()
+        return False
+
+    # Sessions from before signed tokens carried only the username
+    if cookies.get("username"):
+        user = repository.find_user(cookies["username"])
+        cookies["username"] = ""
+        if user:
+            _start_session(user["id"], user["username"])
             return True
     return False
 
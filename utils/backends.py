@@ -0,0 +1,104 @@
+import threading
+
+import numpy as np
+
+
+class InferenceBackend:
+    """Runs the drawing classifier on an (N, 256, 256, 3) float32 batch"""
+
+    name = "base"
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def load(self):
+        raise NotImplementedError
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        """Return an (N, len(classes)) array of class probabilities"""
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    """The original Xception .h5 model through tf.keras"""
+
+    name = "keras"
+
+    def load(self):
+        from tensorflow.keras.models import load_model
+
+        self.model = load_model(self.path)
+        return self
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        return self.model.predict(images, batch_size=len(images), verbose=0)
+
+
+class TFLiteBackend(InferenceBackend):
+    """A float16 or int8 quantized .tflite export of the model"""
+
+    name = "tflite"
+
+    def load(self):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter = Interpreter(model_path=self.path)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input["shape"][0])
+        # An interpreter holds its tensors in place, so calls must not overlap
+        self.lock = threading.Lock()
+        return self
+
+    def _resize(self, batch_size: int):
+        if batch_size != self.batch_size:
+            self.interpreter.resize_tensor_input(self.input["index"], [batch_size, *self.input["shape"][1:]])
+            self.interpreter.allocate_tensors()
+            self.input = self.interpreter.get_input_details()[0]
+            self.output = self.interpreter.get_output_details()[0]
+            self.batch_size = batch_size
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        with self.lock:
+            self._resize(len(images))
+            scale, zero_point = self.input["quantization"]
+            if scale:
+                info = np.iinfo(self.input["dtype"])
+                images = np.clip(np.round(images / scale + zero_point), info.min, info.max)
+            self.interpreter.set_tensor(self.input["index"], images.astype(self.input["dtype"], copy=False))
+            self.interpreter.invoke()
+            preds = self.interpreter.get_tensor(self.output["index"])
+            scale, zero_point = self.output["quantization"]
+            if scale:
+                preds = (preds.astype(np.float32) - zero_point) * scale
+            return np.array(preds, dtype=np.float32)
+
+
+class ONNXBackend(InferenceBackend):
+    """An ONNX Runtime export of the model, optionally int8 quantized"""
+
+    name = "onnx"
+
+    def load(self):
+        import onnxruntime as ort
+
+        self.session = ort.InferenceSession(self.path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        return self
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        return self.session.run(None, {self.input_name: images.astype(np.float32, copy=False)})[0]
+
+
+BACKENDS = {backend.name: backend for backend in (KerasBackend, TFLiteBackend, ONNXBackend)}
+
+
+def create_backend(name: str, path: str) -> InferenceBackend:
+    """Return an unloaded backend of the given kind"""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown model backend '{name}', expected one of {', '.join(BACKENDS)}.")
+    return BACKENDS[name](path)
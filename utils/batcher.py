@@ -0,0 +1,158 @@
+"""Dynamic micro-batching of predictions across sessions.
+
+Every analysis job hands its preprocessed images to one shared scheduler
+instead of calling the model itself. A single worker takes whatever is
+queued, waits up to DRAWEE_MICROBATCH_MAX_WAIT_MS for more to arrive, and
+runs one forward pass for up to DRAWEE_MICROBATCH_MAX_SIZE images, so a burst
+of single-drawing uploads costs a few large passes instead of many small ones.
+
+A batch can only hold requests that are waiting at the same time. In an app
+process those come from at most DRAWEE_ANALYSIS_WORKERS analysis jobs, so the
+in-process wait defaults to 0 (batching off). The inference server, fed by
+every worker on the host, batches with DRAWEE_INFERENCE_BATCH_WAIT_MS.
+"""
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from utils import metrics
+from utils.config import MICROBATCH_MAX_SIZE, MICROBATCH_MAX_WAIT_MS
+
+logger = logging.getLogger(__name__)
+
+FILL_RATIO_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 0.9, 1.0)
+WAIT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+
+class _Request:
+    __slots__ = ("images", "future", "enqueued_at")
+
+    def __init__(self, images: np.ndarray):
+        self.images = images
+        self.future = Future()
+        self.enqueued_at = time.perf_counter()
+
+
+class MicroBatcher:
+    """Collects prediction requests into batches bounded by size and wait time"""
+
+    def __init__(self, predict, max_batch_size: int = MICROBATCH_MAX_SIZE, max_wait: float = MICROBATCH_MAX_WAIT_MS / 1000):
+        self._predict = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending = deque()
+        self._pending_images = 0
+        self._cond = threading.Condition()
+        self._worker = None
+        self._queue_depth = metrics.gauge("drawee_batcher_queue_images")
+        self._fill_ratio = metrics.histogram("drawee_batcher_fill_ratio", buckets=FILL_RATIO_BUCKETS)
+        self._wait = metrics.histogram("drawee_batcher_wait_seconds", buckets=WAIT_BUCKETS)
+        self._batches = metrics.counter("drawee_batcher_batches_total")
+
+    def submit(self, images: np.ndarray) -> Future:
+        """Queue up to max_batch_size images; the future resolves to their probabilities"""
+        if len(images) > self.max_batch_size:
+            raise ValueError(f"At most {self.max_batch_size} images per request, got {len(images)}.")
+        request = _Request(images)
+        with self._cond:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="drawee-batcher", daemon=True)
+                self._worker.start()
+            self._pending.append(request)
+            self._pending_images += len(images)
+            self._queue_depth.set(self._pending_images)
+            self._cond.notify()
+        return request.future
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        """Classify any number of images through the shared batches and wait for the result"""
+        futures = [
+            self.submit(images[start:start + self.max_batch_size])
+            for start in range(0, len(images), self.max_batch_size)
+        ]
+        return np.concatenate([future.result() for future in futures], axis=0)
+
+    def _next_batch(self) -> list:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            # The oldest request sets the deadline, so no caller waits longer than max_wait for company
+            deadline = self._pending[0].enqueued_at + self.max_wait
+            while self._pending_images < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch, size = [], 0
+            while self._pending and size + len(self._pending[0].images) <= self.max_batch_size:
+                request = self._pending.popleft()
+                batch.append(request)
+                size += len(request.images)
+            self._pending_images -= size
+            self._queue_depth.set(self._pending_images)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+            for request in batch:
+                self._wait.observe(started - request.enqueued_at)
+
+            images = batch[0].images if len(batch) == 1 else np.concatenate([r.images for r in batch], axis=0)
+            self._fill_ratio.observe(len(images) / self.max_batch_size)
+            self._batches.inc()
+            try:
+                with metrics.span("batched_predict", len(images)):
+                    probs = self._predict(images)
+            except Exception as e:
+                logger.exception("Batched prediction of %d images failed", len(images))
+                for request in batch:
+                    request.future.set_exception(e)
+                continue
+
+            offset = 0
+            for request in batch:
+                request.future.set_result(probs[offset:offset + len(request.images)])
+                offset += len(request.images)
+
+    def stats(self) -> dict:
+        """Return queue depth, batch count, mean fill ratio and wait-time quantiles"""
+        fill = self._fill_ratio.snapshot()
+        return {
+            "queue_images": self._queue_depth.value,
+            "batches": self._batches.value,
+            "mean_fill_ratio": fill["sum"] / fill["count"] if fill["count"] else 0.0,
+            "wait_p50_seconds": self._wait.quantile(0.5),
+            "wait_p95_seconds": self._wait.quantile(0.95),
+            "max_batch_size": self.max_batch_size,
+            "max_wait_seconds": self.max_wait,
+        }
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher(max_wait: float = MICROBATCH_MAX_WAIT_MS / 1000) -> MicroBatcher:
+    """Return the process-wide scheduler in front of the shared model
+
+    max_wait only applies to the call that creates it.
+    """
+    global _batcher
+    with _batcher_lock:
+        if _batcher is None:
+            from utils.model import get_model
+
+            _batcher = MicroBatcher(lambda images: get_model().predict(images), max_wait=max_wait)
+        return _batcher
+
+
+def get_batcher_stats() -> dict:
+    """Return the shared scheduler's queue and batching figures"""
+    return get_batcher().stats()
@@ -0,0 +1,147 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import metrics
+from utils.config import (
+    PREDICTION_CACHE_SIZE, PREDICTION_CACHE_DIR, MODEL_BACKEND, PREPROCESS_INTERPOLATION, MAX_IMAGE_PIXELS,
+    MAX_IMAGE_PIXELS_SLACK,
+)
+from utils.model import MODEL_VERSION
+
+# Settings that change what the model sees for the same upload
+_PREPROCESS_TAG = hashlib.sha256(
+    f"{PREPROCESS_INTERPOLATION}:{MAX_IMAGE_PIXELS}:{MAX_IMAGE_PIXELS_SLACK}".encode()
+).hexdigest()[:8]
+
+
+def content_hash(data: bytes) -> str:
+    """Return the SHA-256 hex digest used to key cached predictions and stored drawings"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def prediction_key(digest: str) -> str:
+    """Cache key for a drawing under the current model version, backend and preprocessing"""
+    return f"{MODEL_VERSION}-{MODEL_BACKEND}-{_PREPROCESS_TAG}-{digest}"
+
+
+class PredictionCache:
+    """Bounded LRU of predictions keyed by upload hash, with an optional on-disk tier"""
+
+    def __init__(self, max_entries: int, cache_dir: str = ""):
+        self.max_entries = max_entries
+        self.cache_dir = cache_dir
+        # Exported as drawee_prediction_cache_total{result=...}
+        self._hits = metrics.counter("drawee_prediction_cache_total", result="hit")
+        self._disk_hits = metrics.counter("drawee_prediction_cache_total", result="disk_hit")
+        self._misses = metrics.counter("drawee_prediction_cache_total", result="miss")
+        self._size = metrics.gauge("drawee_prediction_cache_entries")
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk(self, key: str):
+        try:
+            with open(self._disk_path(key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entry["percentages"] = np.asarray(entry["percentages"], dtype=np.float32)
+        return entry
+
+    def _write_disk(self, key: str, entry: dict):
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        payload = {**entry, "percentages": [float(p) for p in entry["percentages"]]}
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+    def _remember(self, key: str, entry: dict):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        self._size.set(len(self._entries))
+
+    def get(self, key: str):
+        """Return the cached entry for key, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits.inc()
+                return entry
+
+        entry = self._read_disk(key) if self.cache_dir else None
+        with self._lock:
+            if entry is None:
+                self._misses.inc()
+                return None
+            self._disk_hits.inc()
+            self._remember(key, entry)
+            return entry
+
+    def put(self, key: str, entry: dict):
+        """Store an entry in memory and, if configured, on disk"""
+        with self._lock:
+            self._remember(key, entry)
+        if self.cache_dir:
+            self._write_disk(key, entry)
+
+    def discard(self, key: str):
+        """Drop an entry from memory and disk, e.g. after its stored drawing is removed"""
+        with self._lock:
+            self._entries.pop(key, None)
+            self._size.set(len(self._entries))
+        if self.cache_dir:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def clear(self):
+        """Drop every entry from memory and disk"""
+        with self._lock:
+            self._entries.clear()
+            self._size.set(0)
+        if self.cache_dir:
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".json"):
+                    try:
+                        os.remove(os.path.join(self.cache_dir, name))
+                    except OSError:
+                        pass
+
+    def stats(self) -> dict:
+        """Return hit/miss counters and the current size"""
+        hits, disk_hits, misses = self._hits.value, self._disk_hits.value, self._misses.value
+        lookups = hits + disk_hits + misses
+        with self._lock:
+            return {
+                "hits": hits,
+                "disk_hits": disk_hits,
+                "misses": misses,
+                "hit_rate": (hits + disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+
+prediction_cache = PredictionCache(PREDICTION_CACHE_SIZE, PREDICTION_CACHE_DIR)
+
+
+def get_cache_stats() -> dict:
+    """Return the prediction cache hit/miss counters"""
+    return prediction_cache.stats()
@@ -0,0 +1,165 @@
+"""Removal of stored drawings after deletes, and a sweep for orphaned ones.
+
+Deleting a child or a record removes its rows at once and journals the
+removal of the drawings behind them, which the journal flusher carries out in
+batches. Drawings are content-addressed, so one object can back results of
+several children; it is only removed once no result, inserted or still
+journaled, points at it. The sweep finds objects that no result references
+and removes them at a bounded rate:
+
+    python -m utils.cleanup --dry-run
+    python -m utils.cleanup --rate 10
+"""
+import json
+import time
+import uuid
+import logging
+import argparse
+from datetime import datetime
+
+from utils import journal, repository
+from utils.auth import get_supabase_admin_client
+from utils.config import CLEANUP_BATCH_SIZE, GC_RATE, GC_MIN_AGE, THUMBNAIL_SIZES
+
+logger = logging.getLogger(__name__)
+
+BUCKET = "drawings"
+UPLOAD_FOLDER = "user_uploads"
+
+
+def _bucket():
+    return get_supabase_admin_client().storage.from_(BUCKET)
+
+
+def drawing_paths(digest: str) -> list:
+    """Storage paths of the drawing and thumbnails stored for a content hash"""
+    return [f"{UPLOAD_FOLDER}/{digest}.png"] + [f"{UPLOAD_FOLDER}/{digest}_{size}.webp" for size in THUMBNAIL_SIZES]
+
+
+def digest_of(name: str) -> str:
+    """Return the content hash a stored drawing, thumbnail or public URL was named after"""
+    return name.rsplit("/", 1)[-1].split("?")[0].split(".")[0].split("_")[0]
+
+
+def _in_use(digests) -> set:
+    """Return the digests that an inserted or journaled result points at"""
+    # Matched on the content hash, not the URL, which differs with the project URL or client version
+    pending = {digest_of(url) for url in journal.pending_image_urls()}
+    return repository.referenced_drawings(list(digests)) | (pending & set(digests))
+
+
+def _remove(paths: list, rate: float = 0):
+    """Remove storage objects in batches, pausing to stay under rate objects per second"""
+    bucket = _bucket()
+    for start in range(0, len(paths), CLEANUP_BATCH_SIZE):
+        batch = paths[start:start + CLEANUP_BATCH_SIZE]
+        bucket.remove(batch)
+        if rate:
+            time.sleep(len(batch) / rate)
+
+
+def _forget(digests):
+    # Imported here: the pages import this module, and the cache pulls in NumPy
+    from utils.cache import prediction_cache, prediction_key
+
+    # A later upload of the same photo must be analyzed and stored again
+    for digest in digests:
+        prediction_cache.discard(prediction_key(digest))
+        journal.forget([f"upload:{path}" for path in drawing_paths(digest)])
+
+
+def remove_drawings(image_urls: list, rate: float = 0) -> int:
+    """Remove the stored objects behind image URLs that no result points at any more; returns how many"""
+    digests = {digest_of(url) for url in image_urls}
+    in_use = _in_use(digests)
+    orphans = sorted(digests - in_use)
+    paths = [path for digest in orphans for path in drawing_paths(digest)]
+    if paths:
+        # Forget first: a job that checks in between re-uploads the drawing instead of trusting the cache
+        _forget(orphans)
+        _remove(paths, rate)
+    return len(paths)
+
+
+def _queue_removal(rows: list):
+    urls = sorted({row["image_path"] for row in rows if row.get("image_path")})
+    for start in range(0, len(urls), CLEANUP_BATCH_SIZE):
+        journal.enqueue_removal(f"remove:{uuid.uuid4().hex}", urls[start:start + CLEANUP_BATCH_SIZE])
+
+
+def delete_child(user_id, child_id) -> bool:
+    """Delete a child and its results now and queue removal of their drawings; False if not theirs"""
+    rows = repository.delete_child(user_id, child_id)
+    if rows is None:
+        return False
+    _queue_removal(rows)
+    return True
+
+
+def delete_result(user_id, child_id, result_id) -> bool:
+    """Delete one result now and queue removal of its drawing; returns whether a row was deleted"""
+    row = repository.delete_result(user_id, child_id, result_id)
+    if row is None:
+        return False
+    _queue_removal([row])
+    return True
+
+
+def _created_at(obj: dict) -> float:
+    try:
+        return datetime.fromisoformat(obj["created_at"].replace("Z", "+00:00")).timestamp()
+    except (KeyError, AttributeError, ValueError):
+        return time.time()
+
+
+def collect_garbage(rate: float = GC_RATE, min_age: int = GC_MIN_AGE, dry_run: bool = False) -> dict:
+    """Remove stored drawings older than min_age that no result points at, at most rate per second"""
+    bucket = _bucket()
+    cutoff = time.time() - min_age
+    stats = {"scanned": 0, "orphaned": 0, "removed": 0}
+    offset = 0
+    while True:
+        page = bucket.list(UPLOAD_FOLDER, {
+            "limit": CLEANUP_BATCH_SIZE, "offset": offset, "sortBy": {"column": "name", "order": "asc"},
+        })
+        if not page:
+            break
+        # Folders have no id
+        objects = [obj for obj in page if obj.get("id")]
+        stats["scanned"] += len(objects)
+
+        groups = {}
+        for obj in objects:
+            groups.setdefault(digest_of(obj["name"]), []).append(obj)
+        in_use = _in_use(groups)
+
+        orphans = [
+            f"{UPLOAD_FOLDER}/{obj['name']}"
+            for digest, group in groups.items() if digest not in in_use
+            for obj in group if _created_at(obj) < cutoff
+        ]
+        stats["orphaned"] += len(orphans)
+        if orphans and not dry_run:
+            _forget({digest_of(path) for path in orphans})
+            _remove(orphans, rate)
+            stats["removed"] += len(orphans)
+            logger.info("Removed %d orphaned objects", len(orphans))
+
+        # Removed objects no longer take up a slot in the listing
+        offset += len(page) - (0 if dry_run else len(orphans))
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove stored drawings that no result points at.")
+    parser.add_argument("--dry-run", action="store_true", help="only count orphaned objects")
+    parser.add_argument("--rate", type=float, default=GC_RATE, help="objects removed per second")
+    parser.add_argument("--min-age", type=int, default=GC_MIN_AGE, help="seconds an object must exist first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(collect_garbage(args.rate, args.min_age, args.dry_run), indent=2))
+
+
+if __name__ == "__main__":
+    main()
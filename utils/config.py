@@ -0,0 +1,82 @@
+import os
+
+# Tunables for the analysis pipeline; override with environment variables per deployment
+ANALYSIS_WORKERS = int(os.environ.get("DRAWEE_ANALYSIS_WORKERS", "2"))
+PREPROCESS_WORKERS = int(os.environ.get("DRAWEE_PREPROCESS_WORKERS", "4"))
+PREDICT_BATCH_SIZE = int(os.environ.get("DRAWEE_PREDICT_BATCH_SIZE", "16"))
+PREDICTION_CACHE_SIZE = int(os.environ.get("DRAWEE_PREDICTION_CACHE_SIZE", "1024"))
+# Leave empty to keep the prediction cache in memory only
+PREDICTION_CACHE_DIR = os.environ.get("DRAWEE_PREDICTION_CACHE_DIR", "")
+# Seconds a per-user query result may be reused across reruns
+QUERY_CACHE_TTL = float(os.environ.get("DRAWEE_QUERY_CACHE_TTL", "30"))
+PREPROCESS_INTERPOLATION = os.environ.get("DRAWEE_PREPROCESS_INTERPOLATION", "linear")
+# Uploads are decoded and stored at no more than this many pixels (about 1600x1200)
+MAX_IMAGE_PIXELS = int(os.environ.get("DRAWEE_MAX_IMAGE_PIXELS", "2000000"))
+# Images up to this fraction over the cap are kept as they are; resizing 1080p to fit costs more than decoding it
+MAX_IMAGE_PIXELS_SLACK = float(os.environ.get("DRAWEE_MAX_IMAGE_PIXELS_SLACK", "0.1"))
+# Uploads above this are rejected before decoding
+MAX_UPLOAD_PIXELS = int(os.environ.get("DRAWEE_MAX_UPLOAD_PIXELS", "100000000"))
+# Longest side in px of the WebP thumbnails stored next to each drawing; the first is saved on the results row
+THUMBNAIL_SIZES = tuple(int(v) for v in os.environ.get("DRAWEE_THUMBNAIL_SIZES", "256,512").split(","))
+RECORDS_PAGE_SIZE = int(os.environ.get("DRAWEE_RECORDS_PAGE_SIZE", "10"))
+# keras (the .h5), tflite or onnx; converted artifacts come from scripts/convert_model.py
+MODEL_BACKEND = os.environ.get("DRAWEE_MODEL_BACKEND", "keras")
+# Leave empty to use the default artifact path for the backend
+MODEL_ARTIFACT_PATH = os.environ.get("DRAWEE_MODEL_PATH", "")
+# Directory (or file) holding model artifacts for hosts that must not download at runtime
+MODEL_MIRROR = os.environ.get("DRAWEE_MODEL_MIRROR", "")
+# Seconds a signed session cookie stays valid, and how often it is re-checked against the users table
+SESSION_TTL = int(os.environ.get("DRAWEE_SESSION_TTL", str(7 * 24 * 3600)))
+SESSION_REVALIDATE_TTL = int(os.environ.get("DRAWEE_SESSION_REVALIDATE_TTL", "900"))
+# bcrypt work factor for new hashes; existing hashes keep the cost they were made with
+BCRYPT_ROUNDS = int(os.environ.get("DRAWEE_BCRYPT_ROUNDS", "12"))
+PASSWORD_WORKERS = int(os.environ.get("DRAWEE_PASSWORD_WORKERS", "2"))
+# Password checks allowed to wait for a worker, and how long a new one waits for a slot
+PASSWORD_QUEUE_SIZE = int(os.environ.get("DRAWEE_PASSWORD_QUEUE_SIZE", "32"))
+PASSWORD_QUEUE_TIMEOUT = float(os.environ.get("DRAWEE_PASSWORD_QUEUE_TIMEOUT", "2"))
+# Supabase HTTP: seconds per request, pool sizes, and retries on transient errors
+SUPABASE_TIMEOUT = float(os.environ.get("DRAWEE_SUPABASE_TIMEOUT", "10"))
+STORAGE_TIMEOUT = float(os.environ.get("DRAWEE_STORAGE_TIMEOUT", "30"))
+SUPABASE_MAX_CONNECTIONS = int(os.environ.get("DRAWEE_SUPABASE_MAX_CONNECTIONS", "50"))
+SUPABASE_KEEPALIVE_CONNECTIONS = int(os.environ.get("DRAWEE_SUPABASE_KEEPALIVE_CONNECTIONS", "20"))
+SUPABASE_KEEPALIVE_EXPIRY = float(os.environ.get("DRAWEE_SUPABASE_KEEPALIVE_EXPIRY", "30"))
+SUPABASE_RETRIES = int(os.environ.get("DRAWEE_SUPABASE_RETRIES", "3"))
+SUPABASE_RETRY_BASE_DELAY = float(os.environ.get("DRAWEE_SUPABASE_RETRY_BASE_DELAY", "0.2"))
+SUPABASE_RETRY_MAX_DELAY = float(os.environ.get("DRAWEE_SUPABASE_RETRY_MAX_DELAY", "3"))
+# Write-behind journal for storage uploads and results inserts
+JOURNAL_PATH = os.environ.get("DRAWEE_JOURNAL_PATH", "data/journal.sqlite3")
+JOURNAL_BATCH_SIZE = int(os.environ.get("DRAWEE_JOURNAL_BATCH_SIZE", "20"))
+JOURNAL_MAX_ATTEMPTS = int(os.environ.get("DRAWEE_JOURNAL_MAX_ATTEMPTS", "8"))
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get("DRAWEE_JOURNAL_FLUSH_INTERVAL", "1"))
+# Seconds finished inserts and removals stay in the journal before they are pruned
+JOURNAL_RETENTION = float(os.environ.get("DRAWEE_JOURNAL_RETENTION", str(24 * 60 * 60)))
+# Removal of stored drawings after deletes, and the orphan sweep
+CLEANUP_BATCH_SIZE = int(os.environ.get("DRAWEE_CLEANUP_BATCH_SIZE", "100"))
+GC_RATE = float(os.environ.get("DRAWEE_GC_RATE", "20"))
+GC_MIN_AGE = int(os.environ.get("DRAWEE_GC_MIN_AGE", str(24 * 60 * 60)))
+# Prometheus text export of the in-process metrics; 0 and empty disable each
+METRICS_PORT = int(os.environ.get("DRAWEE_METRICS_PORT", "0"))
+# Each process on a host takes the first free port from METRICS_PORT up
+METRICS_PORT_RANGE = int(os.environ.get("DRAWEE_METRICS_PORT_RANGE", "16"))
+METRICS_FILE = os.environ.get("DRAWEE_METRICS_FILE", "")
+METRICS_FILE_INTERVAL = float(os.environ.get("DRAWEE_METRICS_FILE_INTERVAL", "15"))
+# Replace Supabase with the in-process fake from utils/fake_supabase.py, e.g. for load tests
+FAKE_SUPABASE = os.environ.get("DRAWEE_FAKE_SUPABASE", "") not in ("", "0", "false")
+FAKE_SUPABASE_LATENCY_MS = os.environ.get("DRAWEE_FAKE_SUPABASE_LATENCY_MS", "0")
+# Concurrent predictions from all sessions are merged into batches of up to this many images,
+# waiting at most this long for a batch to fill; a wait of 0 runs each request on its own
+MICROBATCH_MAX_SIZE = int(os.environ.get("DRAWEE_MICROBATCH_MAX_SIZE", "32"))
+# In-process, only the ANALYSIS_WORKERS jobs predicting at once can share a batch, so waiting
+# for company buys little; off by default. Raise ANALYSIS_WORKERS before turning it on.
+MICROBATCH_MAX_WAIT_MS = float(os.environ.get("DRAWEE_MICROBATCH_MAX_WAIT_MS", "0"))
+# The inference server batches requests from every worker on the host
+INFERENCE_BATCH_WAIT_MS = float(os.environ.get("DRAWEE_INFERENCE_BATCH_WAIT_MS", "10"))
+# Base URL of a shared host-local inference server (python -m utils.inference_server); empty
+# loads the model in every app process
+INFERENCE_URL = os.environ.get("DRAWEE_INFERENCE_URL", "")
+INFERENCE_TIMEOUT = float(os.environ.get("DRAWEE_INFERENCE_TIMEOUT", "30"))
+# After the server fails, predict in-process for this many seconds before trying it again
+INFERENCE_RETRY_AFTER = float(os.environ.get("DRAWEE_INFERENCE_RETRY_AFTER", "30"))
+# Admission control for analyses: jobs allowed to wait beyond the busy workers, and jobs per user
+ANALYSIS_QUEUE_SIZE = int(os.environ.get("DRAWEE_ANALYSIS_QUEUE_SIZE", "8"))
+ANALYSIS_JOBS_PER_USER = int(os.environ.get("DRAWEE_ANALYSIS_JOBS_PER_USER", "1"))
@@ -0,0 +1,431 @@
+"""In-process stand-in for the Supabase project, for load tests and local runs.
+
+Implements the subset of the PostgREST, RPC and storage API the app uses,
+over in-memory tables, with an injected delay per call. Enable it with
+
+    DRAWEE_FAKE_SUPABASE=1 DRAWEE_FAKE_SUPABASE_LATENCY_MS="select=15,insert=30,upload=80"
+
+The delay spec is either one number of milliseconds for every call or
+operation=ms pairs, where "default" covers the rest.
+"""
+import re
+import time
+import uuid
+import random
+import threading
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from utils.config import FAKE_SUPABASE_LATENCY_MS
+
+FAKE_URL = "http://fake-supabase.local"
+# Jitter around each injected delay, as a fraction of it
+LATENCY_JITTER = 0.5
+
+
+class FakeAPIError(Exception):
+    def __init__(self, message: str, code: int = 400):
+        super().__init__(message)
+        self.code = code
+
+
+class FakeResponse:
+    def __init__(self, data):
+        self.data = data
+
+
+def parse_latency(spec: str) -> dict:
+    """Turn "20" or "select=10,upload=80" into seconds per operation"""
+    latency = {}
+    for part in filter(None, (p.strip() for p in (spec or "").split(","))):
+        operation, _, ms = part.rpartition("=")
+        latency[operation or "default"] = float(ms) / 1000
+    return latency
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _split_top_level(expr: str) -> list:
+    """Split a PostgREST logic expression on commas outside parentheses and quotes"""
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in expr:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        elif not quoted and char == "," and depth == 0:
+            parts.append(current)
+            current = ""
+            continue
+        current += char
+    parts.append(current)
+    return parts
+
+
+def _compare(value, op: str, operand) -> bool:
+    if op == "in":
+        return str(value) in {str(v) for v in operand}
+    if op == "is":
+        return value is None if str(operand).lower() == "null" else str(value).lower() == str(operand).lower()
+    if value is None:
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        operand = float(operand)
+    elif isinstance(operand, str) or not isinstance(value, type(operand)):
+        value, operand = str(value), str(operand)
+    return {
+        "eq": value == operand, "neq": value != operand,
+        "lt": value < operand, "lte": value <= operand,
+        "gt": value > operand, "gte": value >= operand,
+    }[op]
+
+
+def _logic_filter(expr: str, combine=any):
+    """Build a row predicate from an or_() expression such as a.lt.1,and(a.eq.1,b.lt.2)"""
+    predicates = []
+    for part in _split_top_level(expr):
+        match = re.fullmatch(r"(and|or)\((.*)\)", part.strip())
+        if match:
+            predicates.append(_logic_filter(match.group(2), all if match.group(1) == "and" else any))
+            continue
+        column, op, operand = part.strip().split(".", 2)
+        operand = operand[1:-1] if operand.startswith('"') and operand.endswith('"') else operand
+        predicates.append(lambda row, c=column, o=op, v=operand: _compare(row.get(c), o, v))
+    return lambda row: combine(p(row) for p in predicates)
+
+
+class FakeQuery:
+    """A PostgREST request builder over one in-memory table or view"""
+
+    def __init__(self, database, table: str):
+        self._db = database
+        self._table = table
+        self._operation = "select"
+        self._columns = None
+        self._rows = None
+        self._values = None
+        self._on_conflict = ""
+        self._ignore_duplicates = False
+        self._filters = []
+        self._order = []
+        self._limit = None
+
+    # --- Operations ---
+
+    def select(self, columns: str = "*", **kwargs):
+        self._operation = "select"
+        self._columns = None if columns.strip() == "*" else [c.strip() for c in columns.split(",")]
+        return self
+
+    def insert(self, rows, **kwargs):
+        self._operation = "insert"
+        self._rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict: str = "", ignore_duplicates: bool = False, **kwargs):
+        self.insert(rows)
+        self._operation = "upsert"
+        self._on_conflict = on_conflict or "id"
+        self._ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values: dict, **kwargs):
+        self._operation = "update"
+        self._values = values
+        return self
+
+    def delete(self, **kwargs):
+        self._operation = "delete"
+        return self
+
+    # --- Filters and modifiers ---
+
+    def _filter(self, column: str, op: str, value):
+        self._filters.append(lambda row: _compare(row.get(column), op, value))
+        return self
+
+    def eq(self, column, value):
+        return self._filter(column, "eq", value)
+
+    def neq(self, column, value):
+        return self._filter(column, "neq", value)
+
+    def lt(self, column, value):
+        return self._filter(column, "lt", value)
+
+    def lte(self, column, value):
+        return self._filter(column, "lte", value)
+
+    def gt(self, column, value):
+        return self._filter(column, "gt", value)
+
+    def gte(self, column, value):
+        return self._filter(column, "gte", value)
+
+    def in_(self, column, values):
+        return self._filter(column, "in", list(values))
+
+    def or_(self, filters: str, **kwargs):
+        self._filters.append(_logic_filter(filters))
+        return self
+
+    def order(self, column: str, desc: bool = False, **kwargs):
+        self._order.append((column, desc))
+        return self
+
+    def limit(self, size: int, **kwargs):
+        self._limit = size
+        return self
+
+    # --- Execution ---
+
+    def _matches(self, row: dict) -> bool:
+        return all(f(row) for f in self._filters)
+
+    def _project(self, row: dict) -> dict:
+        if self._columns is None:
+            return dict(row)
+        return {c: row.get(c) for c in self._columns}
+
+    def execute(self) -> FakeResponse:
+        self._db.delay(self._operation)
+        with self._db.lock:
+            if self._operation == "select":
+                rows = [row for row in self._db.rows(self._table) if self._matches(row)]
+                # Stable sorts applied last key first give a multi-column order
+                for column, desc in reversed(self._order):
+                    rows.sort(key=lambda row: (row.get(column) is None, row.get(column)), reverse=desc)
+                if self._limit is not None:
+                    rows = rows[:self._limit]
+                return FakeResponse([self._project(row) for row in rows])
+
+            table = self._db.table_rows(self._table)
+            if self._operation in ("insert", "upsert"):
+                inserted = []
+                for row in self._rows:
+                    row = {"id": str(uuid.uuid4()), "created_at": _now(), **row}
+                    if self._operation == "upsert":
+                        existing = next((r for r in table if r.get(self._on_conflict) == row.get(self._on_conflict)
+                                         and row.get(self._on_conflict) is not None), None)
+                        if existing is not None:
+                            if not self._ignore_duplicates:
+                                existing.update(row)
+                                inserted.append(dict(existing))
+                            continue
+                    table.append(row)
+                    inserted.append(dict(row))
+                return FakeResponse(inserted)
+
+            matched = [row for row in table if self._matches(row)]
+            if self._operation == "update":
+                for row in matched:
+                    row.update(self._values)
+            else:
+                table[:] = [row for row in table if not self._matches(row)]
+            return FakeResponse([dict(row) for row in matched])
+
+
+class FakeRPC:
+    def __init__(self, database, fn: str, params: dict):
+        self._db = database
+        self._fn = fn
+        self._params = params
+
+    def execute(self) -> FakeResponse:
+        self._db.delay("rpc")
+        handler = getattr(self._db, f"rpc_{self._fn}", None)
+        if handler is None:
+            raise FakeAPIError(f"Could not find the function public.{self._fn}", code=404)
+        with self._db.lock:
+            return FakeResponse(handler(**self._params))
+
+
+class FakeBucket:
+    """A storage bucket kept in memory"""
+
+    def __init__(self, database, name: str):
+        self._db = database
+        self.id = name
+
+    def _objects(self) -> dict:
+        return self._db.objects.setdefault(self.id, {})
+
+    def upload(self, path: str, file, file_options: dict = None):
+        self._db.delay("upload")
+        options = file_options or {}
+        with self._db.lock:
+            objects = self._objects()
+            if path in objects and str(options.get("upsert", "false")).lower() != "true":
+                raise FakeAPIError("The resource already exists", code=409)
+            objects[path] = {
+                "data": bytes(file),
+                "content_type": options.get("content-type", "application/octet-stream"),
+                "id": objects.get(path, {}).get("id") or str(uuid.uuid4()),
+                "created_at": _now(),
+            }
+        return {"path": path}
+
+    def get_public_url(self, path: str, options: dict = None) -> str:
+        return f"{FAKE_URL}/storage/v1/object/public/{self.id}/{path}"
+
+    def download(self, path: str, options: dict = None) -> bytes:
+        self._db.delay("download")
+        with self._db.lock:
+            obj = self._objects().get(path)
+        if obj is None:
+            raise FakeAPIError("Object not found", code=404)
+        return obj["data"]
+
+    def remove(self, paths: list) -> list:
+        self._db.delay("remove")
+        with self._db.lock:
+            objects = self._objects()
+            return [{"name": path} for path in paths if objects.pop(path, None) is not None]
+
+    def list(self, path: str = None, options: dict = None) -> list:
+        self._db.delay("list")
+        options = options or {}
+        prefix = f"{path.rstrip('/')}/" if path else ""
+        with self._db.lock:
+            entries = [
+                {"name": key[len(prefix):], "id": obj["id"], "created_at": obj["created_at"],
+                 "metadata": {"size": len(obj["data"]), "mimetype": obj["content_type"]}}
+                for key, obj in self._objects().items()
+                if key.startswith(prefix) and "/" not in key[len(prefix):]
+            ]
+        if options.get("search"):
+            entries = [e for e in entries if options["search"] in e["name"]]
+        sort_by = options.get("sortBy") or {"column": "name", "order": "asc"}
+        entries.sort(key=lambda e: e.get(sort_by["column"]) or "", reverse=sort_by.get("order") == "desc")
+        offset = options.get("offset", 0)
+        return entries[offset:offset + options.get("limit", 100)]
+
+
+class FakeStorage:
+    def __init__(self, database):
+        self._db = database
+
+    def from_(self, bucket: str) -> FakeBucket:
+        return FakeBucket(self._db, bucket)
+
+
+class FakeSupabase:
+    """In-memory tables, views, RPCs and buckets shaped like the app's Supabase project"""
+
+    def __init__(self, latency: dict = None):
+        self.latency = latency or {}
+        self.lock = threading.RLock()
+        self.storage = FakeStorage(self)
+        self.reset()
+
+    def reset(self):
+        """Drop every row and stored object"""
+        with self.lock:
+            self.tables = {"users": [], "children": [], "results": []}
+            self.objects = {}
+
+    def delay(self, operation: str):
+        base = self.latency.get(operation, self.latency.get("default", 0))
+        if base:
+            time.sleep(base * random.uniform(1 - LATENCY_JITTER, 1 + LATENCY_JITTER))
+
+    def table_rows(self, name: str) -> list:
+        return self.tables.setdefault(name, [])
+
+    def rows(self, name: str) -> list:
+        """Rows of a table or of one of the views from supabase/migrations"""
+        if name == "children_summary":
+            return self._children_summary()
+        return self.table_rows(name)
+
+    def _children_summary(self) -> list:
+        summary = []
+        for child in self.tables["children"]:
+            results = [r for r in self.tables["results"] if r.get("child_id") == child["id"]]
+            summary.append({
+                "id": child["id"], "user_id": child["user_id"], "name": child["name"],
+                "record_count": len(results),
+                "last_analyzed_at": max((r["created_at"] for r in results), default=None),
+            })
+        return summary
+
+    def table(self, name: str) -> FakeQuery:
+        return FakeQuery(self, name)
+
+    def rpc(self, fn: str, params: dict = None) -> FakeRPC:
+        return FakeRPC(self, fn, params or {})
+
+    # --- RPCs from supabase/migrations ---
+
+    def rpc_child_records_summary(self, p_child_id):
+        results = [r for r in self.tables["results"] if r.get("child_id") == p_child_id]
+        counts = {}
+        daily = {}
+        for r in results:
+            counts[r["prediction"]] = counts.get(r["prediction"], 0) + 1
+            day = datetime.fromisoformat(r["created_at"]).astimezone(ZoneInfo("Asia/Manila")).date().isoformat()
+            daily[(day, r["prediction"])] = daily.get((day, r["prediction"]), 0) + 1
+        stage_counts = sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+        return {
+            "total": len(results),
+            "stage_counts": [{"prediction": p, "count": c} for p, c in stage_counts],
+            "most_common": stage_counts[0][0] if stage_counts else None,
+            "daily": [{"created_date": d, "prediction": p, "count": c} for (d, p), c in sorted(daily.items())],
+        }
+
+    def rpc_referenced_drawings(self, p_digests):
+        wanted = set(p_digests)
+        # Same as the image_digest column in the migration
+        digests = (re.search(r"user_uploads/([^/?._]+)", r.get("image_path") or "") for r in self.tables["results"])
+        found = {m.group(1) for m in digests if m and m.group(1) in wanted}
+        return [{"digest": digest} for digest in sorted(found)]
+
+
+class SessionCookies:
+    """Cookie jar kept in session state, for runs where the browser cookie component cannot load"""
+
+    _KEY = "_fake_cookies"
+
+    def _jar(self) -> dict:
+        import streamlit as st
+
+        return st.session_state.setdefault(self._KEY, {})
+
+    def ready(self) -> bool:
+        return True
+
+    def get(self, key: str, default=None):
+        return self._jar().get(key, default)
+
+    def __getitem__(self, key: str):
+        return self._jar()[key]
+
+    def __setitem__(self, key: str, value):
+        self._jar()[key] = value
+
+    def save(self):
+        pass
+
+
+_database = None
+_database_lock = threading.Lock()
+
+
+def get_database() -> FakeSupabase:
+    """Return the process-wide fake project, shared by every session like the real one"""
+    global _database
+    with _database_lock:
+        if _database is None:
+            _database = FakeSupabase(parse_latency(FAKE_SUPABASE_LATENCY_MS))
+        return _database
+
+
+def create_fake_client():
+    """Return the fake project behind the same retries and metrics as a real client"""
+    from utils.supabase_client import InstrumentedClient
+
+    return InstrumentedClient(get_database())
@@ -0,0 +1,170 @@
+"""Host-local inference server, so several app processes share one model.
+
+Start one per host and point every Streamlit worker at it:
+
+    python -m utils.inference_server --port 8765
+    DRAWEE_INFERENCE_URL=http://127.0.0.1:8765 streamlit run Home.py
+
+POST /predict takes either an (N, 256, 256, 3) float32 batch saved with
+numpy.save (Content-Type application/x-npy) or one raw PNG/JPEG upload
+(Content-Type image/*). It returns the probabilities over classes_def.classes.
+Requests from all workers share the server's micro-batches. GET /health
+reports the model version and backend. If the server cannot be reached, the
+app predicts in-process instead.
+"""
+import io
+import json
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from utils import metrics
+from utils.config import INFERENCE_URL, INFERENCE_TIMEOUT, INFERENCE_RETRY_AFTER, INFERENCE_BATCH_WAIT_MS
+
+logger = logging.getLogger(__name__)
+
+NPY_CONTENT_TYPE = "application/x-npy"
+
+
+# --- Server ---
+
+class InferenceHandler(BaseHTTPRequestHandler):
+    # Keep-alive, so each worker's pooled connection is reused
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": "Not found."})
+            return
+        from utils.model import get_model_stats
+
+        self._send_json(200, get_model_stats())
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.path != "/predict":
+            self._send_json(404, {"error": "Not found."})
+            return
+
+        from classes_def import classes
+        from utils.batcher import get_batcher
+        from utils.model import INPUT_SHAPE, MODEL_VERSION
+
+        content_type = self.headers.get("Content-Type", "")
+        try:
+            if content_type == NPY_CONTENT_TYPE:
+                images = np.load(io.BytesIO(body), allow_pickle=False)
+                if images.ndim != 4 or images.shape[1:] != INPUT_SHAPE or images.dtype != np.float32:
+                    raise ValueError(f"Expected an (N, {', '.join(map(str, INPUT_SHAPE))}) float32 batch.")
+            elif content_type.startswith("image/"):
+                from utils.preprocess import allocate_batch, decode_image, preprocess_into
+
+                images = allocate_batch(1)
+                preprocess_into(decode_image(body), images[0])
+            else:
+                self._send_json(415, {"error": f"Unsupported content type '{content_type}'."})
+                return
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+            return
+
+        try:
+            with metrics.span("server_predict", len(images)):
+                probs = get_batcher().predict(images)
+        except Exception as e:
+            logger.exception("Prediction failed")
+            self._send_json(500, {"error": str(e)})
+            return
+        self._send_json(200, {"model_version": MODEL_VERSION, "classes": classes, "probabilities": probs.tolist()})
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+def serve(host: str = "127.0.0.1", port: int = 8765):
+    """Load the model and serve predictions until interrupted"""
+    from utils.batcher import get_batcher
+    from utils.model import warm_up
+
+    warm_up()
+    # Requests from every worker on the host meet here, so waiting for a fuller batch pays off
+    get_batcher(INFERENCE_BATCH_WAIT_MS / 1000)
+    metrics.start_exporter()
+    server = ThreadingHTTPServer((host, port), InferenceHandler)
+    logger.info("Inference server listening on http://%s:%d", host, port)
+    server.serve_forever()
+
+
+# --- Client ---
+
+class InferenceClient:
+    """Sends preprocessed batches to the inference server over one pooled connection"""
+
+    def __init__(self, url: str, timeout: float = INFERENCE_TIMEOUT):
+        import httpx
+
+        self._http = httpx.Client(base_url=url, timeout=timeout)
+
+    def predict(self, images: np.ndarray) -> np.ndarray:
+        buffer = io.BytesIO()
+        np.save(buffer, np.ascontiguousarray(images, dtype=np.float32), allow_pickle=False)
+        response = self._http.post("/predict", content=buffer.getvalue(), headers={"Content-Type": NPY_CONTENT_TYPE})
+        response.raise_for_status()
+        return np.asarray(response.json()["probabilities"], dtype=np.float32)
+
+    def health(self) -> dict:
+        response = self._http.get("/health")
+        response.raise_for_status()
+        return response.json()
+
+
+_client = None
+_client_lock = threading.Lock()
+_unavailable_until = 0.0
+
+
+def predict_remote(images: np.ndarray):
+    """Classify on the configured server; None means predict in-process instead"""
+    global _client, _unavailable_until
+    if not INFERENCE_URL or time.monotonic() < _unavailable_until:
+        return None
+    import httpx
+
+    with _client_lock:
+        if _client is None:
+            _client = InferenceClient(INFERENCE_URL)
+    try:
+        return _client.predict(images)
+    except httpx.HTTPError as e:
+        # Give the server a rest instead of paying a failed request on every analysis
+        _unavailable_until = time.monotonic() + INFERENCE_RETRY_AFTER
+        metrics.counter("drawee_inference_fallbacks_total").inc()
+        logger.warning("Inference server %s failed (%s); predicting in-process for %.0fs",
+                       INFERENCE_URL, e, INFERENCE_RETRY_AFTER)
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve drawing predictions to the app processes on this host.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port)
+
+
+if __name__ == "__main__":
+    main()
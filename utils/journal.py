@@ -0,0 +1,373 @@
+"""Durable write-behind journal for drawing uploads, result inserts and removals.
+
+The analysis job records what has to reach Supabase here and returns at once;
+a background flusher drains the journal in batches, retrying with backoff.
+Every entry has an idempotency key, so a retry never stores a drawing or a
+result twice. Finished uploads are kept only as their key, in the stored
+table, and finished inserts and removals are pruned after JOURNAL_RETENTION
+seconds. To see what is waiting or has given up:
+
+    python -m utils.journal
+    python -m utils.journal --retry-failed
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+
+from utils import metrics
+from utils.config import JOURNAL_PATH, JOURNAL_BATCH_SIZE, JOURNAL_MAX_ATTEMPTS, JOURNAL_FLUSH_INTERVAL, JOURNAL_RETENTION
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+_SCHEMA = """
+create table if not exists entries (
+    key text primary key,
+    kind text not null,
+    payload text not null,
+    data blob,
+    status text not null default 'pending',
+    attempts integer not null default 0,
+    last_error text,
+    created_at real not null,
+    next_attempt_at real not null
+);
+create index if not exists entries_status_next_idx on entries (status, next_attempt_at);
+create table if not exists stored (
+    key text primary key
+);
+"""
+
+# Seconds between sweeps of finished entries
+_PRUNE_INTERVAL = 60
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_flusher = None
+_flusher_lock = threading.Lock()
+
+
+def _connect():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(JOURNAL_PATH) or ".", exist_ok=True)
+        conn = sqlite3.connect(JOURNAL_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("pragma journal_mode=wal")
+        conn.executescript(_SCHEMA)
+        _migrate(conn)
+        _local.conn = conn
+    return conn
+
+
+@contextmanager
+def _transaction(conn):
+    conn.execute("begin immediate")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("rollback")
+        raise
+    conn.execute("commit")
+
+
+def _migrate(conn):
+    """Bring a journal from before pruning up to date: finished uploads move to the stored table"""
+    if "done_at" in {row["name"] for row in conn.execute("pragma table_info(entries)")}:
+        return
+    # Not under _write_lock: callers may hold it already; begin immediate is enough
+    with _transaction(conn):
+        # Another connection may have migrated it in the meantime
+        if "done_at" in {row["name"] for row in conn.execute("pragma table_info(entries)")}:
+            return
+        conn.execute("alter table entries add column done_at real")
+        conn.execute("insert or ignore into stored (key) select key from entries where kind = 'upload' and status = 'done'")
+        conn.execute("delete from entries where kind = 'upload' and status = 'done'")
+        conn.execute("update entries set done_at = ? where status = 'done'", (time.time(),))
+
+
+def enqueue_upload(key: str, path: str, data: bytes, content_type: str):
+    """Journal a storage upload; a key that is pending or already stored is ignored"""
+    _enqueue(key, "upload", {"path": path, "content_type": content_type}, data)
+
+
+def enqueue_results(key: str, user_id, child_id, rows: list, requires: list = ()):
+    """Journal a batch of results rows, inserted only after the uploads in requires are done"""
+    _enqueue(key, "results", {"user_id": user_id, "child_id": child_id, "rows": rows, "requires": list(requires)})
+
+
+def enqueue_removal(key: str, image_urls: list):
+    """Journal the removal of stored drawings, run after pending uploads and inserts"""
+    _enqueue(key, "remove", {"image_urls": list(image_urls)})
+
+
+def _enqueue(key: str, kind: str, payload: dict, data: bytes = None):
+    now = time.time()
+    with _write_lock:
+        _connect().execute(
+            "insert or ignore into entries (key, kind, payload, data, created_at, next_attempt_at) "
+            "select ?, ?, ?, ?, ?, ? where not exists (select 1 from stored where key = ?)",
+            (key, kind, json.dumps(payload), data, now, now, key),
+        )
+    start_flusher()
+
+
+def _mark(key: str, status: str, attempts: int = None, error: str = None):
+    with _write_lock:
+        conn = _connect()
+        if status == DONE:
+            with _transaction(conn):
+                # A stored upload keeps only its key, for dedup and missing(); the blob is in storage now
+                conn.execute("insert or ignore into stored (key) select key from entries where key = ? and kind = 'upload'", (key,))
+                conn.execute("delete from entries where key = ? and kind = 'upload'", (key,))
+                conn.execute(
+                    "update entries set status = ?, data = null, last_error = null, done_at = ? where key = ?",
+                    (DONE, time.time(), key),
+                )
+        else:
+            delay = min(300, 2 ** attempts)
+            conn.execute(
+                "update entries set status = ?, attempts = ?, last_error = ?, next_attempt_at = ? where key = ?",
+                (status, attempts, error, time.time() + delay, key),
+            )
+
+
+def _fail(entry, error: Exception):
+    attempts = entry["attempts"] + 1
+    status = FAILED if attempts >= JOURNAL_MAX_ATTEMPTS else PENDING
+    logger.warning("Journal %s %s failed (attempt %d): %s", entry["kind"], entry["key"], attempts, error)
+    _mark(entry["key"], status, attempts, str(error))
+
+
+def _blocking(keys: list):
+    """Return (failed, wait_until): whether a required entry failed, and when the pending ones are next due"""
+    if not keys:
+        return False, None
+    placeholders = ",".join("?" * len(keys))
+    rows = _connect().execute(
+        f"select status, next_attempt_at from entries where status != 'done' and key in ({placeholders})", keys
+    ).fetchall()
+    if any(row["status"] == FAILED for row in rows):
+        return True, None
+    if not rows:
+        return False, None
+    return False, max(time.time() + JOURNAL_FLUSH_INTERVAL, max(row["next_attempt_at"] for row in rows))
+
+
+def _defer(key: str, until: float):
+    with _write_lock:
+        _connect().execute("update entries set next_attempt_at = ? where key = ?", (until, key))
+
+
+def pending_image_urls() -> set:
+    """Return the image URLs of results rows that are journaled but not yet inserted"""
+    rows = _connect().execute("select payload from entries where kind = 'results' and status != 'done'")
+    return {row["image_path"] for entry in rows for row in json.loads(entry["payload"])["rows"]}
+
+
+def missing(keys: list) -> list:
+    """Return the keys that are neither journaled nor stored, e.g. because they were forgotten"""
+    if not keys:
+        return []
+    placeholders = ",".join("?" * len(keys))
+    rows = _connect().execute(
+        f"select key from entries where key in ({placeholders}) union select key from stored where key in ({placeholders})",
+        list(keys) * 2,
+    )
+    known = {row["key"] for row in rows}
+    return [key for key in keys if key not in known]
+
+
+def forget(keys: list):
+    """Drop entries so the same key can be journaled again"""
+    if not keys:
+        return
+    placeholders = ",".join("?" * len(keys))
+    with _write_lock:
+        conn = _connect()
+        conn.execute(f"delete from entries where key in ({placeholders})", list(keys))
+        conn.execute(f"delete from stored where key in ({placeholders})", list(keys))
+
+
+def clear():
+    """Drop every entry, whatever its status, and every stored key"""
+    with _write_lock:
+        conn = _connect()
+        conn.execute("delete from entries")
+        conn.execute("delete from stored")
+
+
+def prune(retention: float = JOURNAL_RETENTION) -> int:
+    """Delete inserts and removals that finished more than retention seconds ago; returns how many"""
+    with _write_lock:
+        cur = _connect().execute(
+            "delete from entries where status = 'done' and done_at < ?", (time.time() - retention,)
+        )
+    return cur.rowcount
+
+
+def flush_once(batch_size: int = JOURNAL_BATCH_SIZE) -> int:
+    """Push one batch of due entries to Supabase; returns how many were attempted"""
+    from utils.auth import get_supabase_admin_client
+    from utils.repository import insert_results
+
+    # Each kind gets its own batch, so entries waiting on one kind cannot crowd out the others
+    now = time.time()
+    due = [
+        entry
+        for kind in ("upload", "results", "remove")
+        for entry in _connect().execute(
+            "select * from entries where kind = ? and status = 'pending' and next_attempt_at <= ? "
+            "order by created_at limit ?",
+            (kind, now, batch_size),
+        ).fetchall()
+    ]
+
+    attempted = 0
+    bucket = get_supabase_admin_client().storage.from_("drawings")
+    results = []
+    removals = []
+    for entry in due:
+        payload = json.loads(entry["payload"])
+        if entry["kind"] == "remove":
+            removals.append((entry, payload))
+            continue
+        if entry["kind"] == "results":
+            results.append((entry, payload))
+            continue
+
+        attempted += 1
+        try:
+            with metrics.span("upload"):
+                bucket.upload(
+                    payload["path"], bytes(entry["data"]),
+                    file_options={"content-type": payload["content_type"], "upsert": "true"},
+                )
+        except Exception as e:
+            _fail(entry, e)
+        else:
+            _mark(entry["key"], DONE)
+
+    # Rows only go in once the drawings they point at are stored
+    ready_results = {}
+    for entry, payload in results:
+        failed, wait_until = _blocking(payload["requires"])
+        if failed:
+            attempted += 1
+            logger.warning("Journal results %s gave up: a drawing it needs failed to upload", entry["key"])
+            _mark(entry["key"], FAILED, entry["attempts"], "A required upload failed.")
+        elif wait_until is not None:
+            _defer(entry["key"], wait_until)
+        else:
+            ready_results.setdefault((payload["user_id"], payload["child_id"]), []).append((entry, payload))
+
+    # One insert per child for every ready results entry in the batch
+    for (user_id, child_id), entries in ready_results.items():
+        attempted += len(entries)
+        try:
+            # Upserting on the idempotency key makes a replayed batch a no-op
+            rows = [row for _, payload in entries for row in payload["rows"]]
+            with metrics.span("insert_results", len(rows)):
+                insert_results(user_id, child_id, rows)
+        except Exception as e:
+            for entry, _ in entries:
+                _fail(entry, e)
+        else:
+            for entry, _ in entries:
+                _mark(entry["key"], DONE)
+
+    if removals:
+        from utils.cleanup import remove_drawings
+
+    for entry, payload in removals:
+        attempted += 1
+        try:
+            remove_drawings(payload["image_urls"])
+        except Exception as e:
+            _fail(entry, e)
+        else:
+            _mark(entry["key"], DONE)
+    return attempted
+
+
+def _flush_forever():
+    last_prune = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_prune >= _PRUNE_INTERVAL:
+                last_prune = time.monotonic()
+                prune()
+            if flush_once() == 0:
+                time.sleep(JOURNAL_FLUSH_INTERVAL)
+        except Exception:
+            logger.exception("Journal flush failed")
+            time.sleep(JOURNAL_FLUSH_INTERVAL)
+
+
+def start_flusher():
+    """Start the background flusher once per process"""
+    global _flusher
+    with _flusher_lock:
+        if _flusher is None:
+            _flusher = threading.Thread(target=_flush_forever, name="drawee-journal", daemon=True)
+            _flusher.start()
+
+
+def journal_stats() -> dict:
+    """Return the number of entries per status and kind; done uploads are the stored keys"""
+    conn = _connect()
+    rows = conn.execute("select status, kind, count(*) as n from entries group by status, kind")
+    stats = {PENDING: {}, DONE: {}, FAILED: {}}
+    for row in rows:
+        stats.setdefault(row["status"], {})[row["kind"]] = row["n"]
+    stored = conn.execute("select count(*) as n from stored").fetchone()["n"]
+    if stored:
+        stats[DONE]["upload"] = stored
+    return stats
+
+
+def list_entries(status: str, limit: int = 50) -> list:
+    """Return pending or failed entries, oldest first, without their blobs"""
+    rows = _connect().execute(
+        "select key, kind, status, attempts, last_error, created_at, next_attempt_at "
+        "from entries where status = ? order by created_at limit ?",
+        (status, limit),
+    )
+    return [dict(row) for row in rows]
+
+
+def retry_failed() -> int:
+    """Move failed entries back to pending; returns how many"""
+    with _write_lock:
+        cur = _connect().execute(
+            "update entries set status = 'pending', attempts = 0, next_attempt_at = ? where status = 'failed'",
+            (time.time(),),
+        )
+    return cur.rowcount
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Show pending and failed journal entries.")
+    parser.add_argument("--retry-failed", action="store_true")
+    parser.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.retry_failed:
+        print(f"Requeued {retry_failed()} failed entries.")
+    print(json.dumps(journal_stats(), indent=2))
+    for status in (PENDING, FAILED):
+        for entry in list_entries(status, args.limit):
+            created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["created_at"]))
+            print(f"{status:<8} {entry['kind']:<8} {created}  attempts={entry['attempts']}  {entry['key']}  {entry['last_error'] or ''}")
+
+
+if __name__ == "__main__":
+    main()
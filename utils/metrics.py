@@ -0,0 +1,269 @@
+"""In-process latency histograms and counters, with Prometheus text export.
+
+Set DRAWEE_METRICS_PORT to serve /metrics from each app process, or
+DRAWEE_METRICS_FILE to have the same text rewritten every few seconds. With
+several processes per host, each one serves on the first free port from
+DRAWEE_METRICS_PORT up and writes its own file, e.g. metrics.<pid>.prom with
+a worker="<pid>" label, so point node_exporter's textfile collector at the
+directory.
+"""
+import os
+import time
+import atexit
+import bisect
+import logging
+import threading
+from contextlib import contextmanager
+
+from utils.config import METRICS_PORT, METRICS_PORT_RANGE, METRICS_FILE, METRICS_FILE_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Seconds; covers cache hits through slow uploads and cold model loads
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram, safe to observe from any thread"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.total += value
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket that contains it"""
+        with self._lock:
+            if not self.count:
+                return 0.0
+            rank = q * self.count
+            seen = 0
+            for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+                seen += count
+                if seen >= rank:
+                    return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"count": self.count, "sum": self.total, "buckets": list(zip(self.buckets, self.counts))}
+
+
+class Counter:
+    """Monotonic counter, safe to increment from any thread"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """A value that goes up and down, such as a queue depth"""
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.inc(-amount)
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _metric(kind, name: str, labels: dict):
+    key = (name, tuple(sorted(labels.items())))
+    with _registry_lock:
+        metric = _registry.get(key)
+        if metric is None:
+            metric = _registry[key] = kind()
+        return metric
+
+
+def histogram(name: str, buckets=DEFAULT_BUCKETS, **labels) -> Histogram:
+    """Return the process-wide histogram for a name and label set"""
+    return _metric(lambda: Histogram(buckets), name, labels)
+
+
+def counter(name: str, **labels) -> Counter:
+    """Return the process-wide counter for a name and label set"""
+    return _metric(Counter, name, labels)
+
+
+def gauge(name: str, **labels) -> Gauge:
+    """Return the process-wide gauge for a name and label set"""
+    return _metric(Gauge, name, labels)
+
+
+def collect() -> list:
+    """Return (name, labels, metric) for every registered metric"""
+    with _registry_lock:
+        return [(name, dict(labels), metric) for (name, labels), metric in _registry.items()]
+
+
+def size_bucket(n: int) -> str:
+    """Round a batch size up to a power of two so labels stay few"""
+    bucket = 1
+    while bucket < n and bucket < 64:
+        bucket *= 2
+    return f"{bucket}+" if n > 64 else str(bucket)
+
+
+def stage_histogram(stage: str, batch_size: int = 1) -> Histogram:
+    """Return the drawee_stage_seconds histogram of a stage, tagged with the model version and batch size"""
+    from utils.model import MODEL_VERSION
+
+    return histogram("drawee_stage_seconds", stage=stage, model_version=MODEL_VERSION, batch_size=size_bucket(batch_size))
+
+
+@contextmanager
+def span(stage: str, batch_size: int = 1):
+    """Time a block into the stage histogram"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_histogram(stage, batch_size).observe(time.perf_counter() - start)
+
+
+def _format_labels(labels: dict, **extra) -> str:
+    items = {**labels, **extra}
+    if not items:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in items.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(items, escaped)) + "}"
+
+
+def render_prometheus(extra_labels: dict = None) -> str:
+    """Return every registered metric in the Prometheus text exposition format
+
+    extra_labels are added to every series, e.g. to tell processes apart.
+    """
+    by_name = {}
+    for name, labels, metric in collect():
+        by_name.setdefault(name, []).append(({**(extra_labels or {}), **labels}, metric))
+
+    lines = []
+    for name in sorted(by_name):
+        series = sorted(by_name[name], key=lambda item: sorted(item[0].items()))
+        kind = {Histogram: "histogram", Counter: "counter", Gauge: "gauge"}[type(series[0][1])]
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, metric in series:
+            if kind != "histogram":
+                lines.append(f"{name}{_format_labels(labels)} {metric.value}")
+                continue
+            snapshot = metric.snapshot()
+            cumulative = 0
+            for bound, count in snapshot["buckets"]:
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, le='+Inf')} {snapshot['count']}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {snapshot['sum']}")
+            lines.append(f"{name}_count{_format_labels(labels)} {snapshot['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def process_metrics_path(path: str = METRICS_FILE) -> str:
+    """Return this process's file for path: {pid} is filled in, else the pid goes before the extension"""
+    if "{pid}" in path:
+        return path.format(pid=os.getpid())
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+def write_metrics_file(path: str):
+    """Atomically replace path with the current metrics text, labelled with this process"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus({"worker": str(os.getpid())}))
+    os.replace(tmp_path, path)
+
+
+def _remove_metrics_file(path: str):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _write_forever(path: str):
+    while True:
+        time.sleep(METRICS_FILE_INTERVAL)
+        try:
+            write_metrics_file(path)
+        except OSError:
+            logger.exception("Writing %s failed", path)
+
+
+def _serve(port: int):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    # Several workers per host: each takes the next free port
+    for candidate in range(port, port + max(1, METRICS_PORT_RANGE)):
+        try:
+            server = ThreadingHTTPServer(("127.0.0.1", candidate), MetricsHandler)
+        except OSError:
+            continue
+        threading.Thread(target=server.serve_forever, name="drawee-metrics", daemon=True).start()
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", candidate)
+        return candidate
+    raise OSError(f"No free metrics port in {port}-{port + max(1, METRICS_PORT_RANGE) - 1}")
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def start_exporter():
+    """Start the configured /metrics endpoint and metrics file writer once per process"""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    if METRICS_PORT:
+        try:
+            _serve(METRICS_PORT)
+        except OSError as e:
+            logger.warning("Metrics endpoint unavailable: %s", e)
+    if METRICS_FILE:
+        path = process_metrics_path(METRICS_FILE)
+        # A file left by an exited process would be scraped forever
+        atexit.register(_remove_metrics_file, path)
+        threading.Thread(target=_write_forever, args=(path,), name="drawee-metrics-file", daemon=True).start()
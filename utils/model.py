@@ -0,0 +1,143 @@
+import os
+import time
+import logging
+import threading
+
+from utils.config import INFERENCE_URL, MODEL_BACKEND, MODEL_ARTIFACT_PATH
+from utils.model_fetch import artifact_ready, ensure_model
+
+logger = logging.getLogger(__name__)
+
+MODEL_PATH = "model_cache/drawee-v1.7.h5"
+MODEL_VERSION = "drawee-v1.7"
+# Converted artifacts live next to the .h5; see scripts/convert_model.py
+BACKEND_PATHS = {
+    "keras": MODEL_PATH,
+    "tflite": "model_cache/drawee-v1.7.tflite",
+    "onnx": "model_cache/drawee-v1.7.onnx",
+}
+INPUT_SHAPE = (256, 256, 3)
+
+# One model per process, shared by every Streamlit session
+_model = None
+_model_lock = threading.Lock()
+_warm_up_thread = None
+_stats = {}
+# Seconds before the first warm-up retry; doubles up to five minutes
+_WARM_UP_RETRY_DELAY = 5
+
+
+class ModelUnavailable(Exception):
+    """Raised when a request needs the model before a verified artifact is in place"""
+
+
+def current_rss_mb() -> float:
+    """Return the resident memory of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        # ru_maxrss is the peak, reported in KB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def model_path(backend: str = MODEL_BACKEND) -> str:
+    """Return the artifact path for a backend, honouring DRAWEE_MODEL_PATH"""
+    return MODEL_ARTIFACT_PATH or BACKEND_PATHS[backend]
+
+
+def _load_model():
+    path = model_path()
+    # Requests never download: utils.model_fetch or the warm-up thread puts the artifact in place
+    if not os.path.exists(path) or (not MODEL_ARTIFACT_PATH and not artifact_ready(MODEL_BACKEND)):
+        raise ModelUnavailable("The drawing model is not available yet. Please try again in a few minutes.")
+
+    rss_before = current_rss_mb()
+    start = time.perf_counter()
+    from utils.backends import create_backend
+
+    model = create_backend(MODEL_BACKEND, path).load()
+    _stats["backend"] = MODEL_BACKEND
+    _stats["load_seconds"] = time.perf_counter() - start
+    _stats["rss_mb"] = current_rss_mb()
+    _stats["model_rss_mb"] = _stats["rss_mb"] - rss_before
+    logger.info(
+        "Loaded %s (%s) in %.2fs (rss %.0f MB, +%.0f MB)",
+        MODEL_VERSION, MODEL_BACKEND, _stats["load_seconds"], _stats["rss_mb"], _stats["model_rss_mb"],
+    )
+    return model
+
+
+def get_model():
+    """Return the process-wide inference backend, loading it on first use
+
+    Raises ModelUnavailable if the artifact has not been fetched yet.
+    """
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                _model = _load_model()
+    return _model
+
+
+def set_model(model):
+    """Replace the shared model, e.g. with a stand-in when the real weights are not available"""
+    global _model
+    with _model_lock:
+        _model = model
+        _stats["backend"] = getattr(model, "name", type(model).__name__)
+
+
+def warm_up():
+    """Fetch and load the model and run one dummy prediction so the first user skips the cold trace"""
+    import numpy as np
+
+    if _model is None and not MODEL_ARTIFACT_PATH:
+        # Normally a no-op: utils.model_fetch ran before serving and left a verified file
+        ensure_model(MODEL_BACKEND)
+    model = get_model()
+    if "warm_up_seconds" in _stats:
+        return
+    start = time.perf_counter()
+    model.predict(np.zeros((1, *INPUT_SHAPE), dtype=np.float32))
+    _stats["warm_up_seconds"] = time.perf_counter() - start
+    _stats["rss_mb"] = current_rss_mb()
+    logger.info("Warmed up %s in %.2fs", MODEL_VERSION, _stats["warm_up_seconds"])
+
+
+def _warm_up_safely():
+    delay = _WARM_UP_RETRY_DELAY
+    while True:
+        try:
+            warm_up()
+            return
+        except Exception:
+            logger.exception("Model warm-up failed; retrying in %ds", delay)
+        time.sleep(delay)
+        delay = min(300, delay * 2)
+
+
+def start_warm_up():
+    """Warm the model on a background thread, retrying until it loads; safe to call on every rerun"""
+    global _warm_up_thread
+    if INFERENCE_URL:
+        # The host's inference server holds the model; it is only loaded here as a fallback
+        return
+    with _model_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=_warm_up_safely, name="drawee-warm-up", daemon=True)
+            _warm_up_thread.start()
+
+
+def get_model_stats() -> dict:
+    """Return load time, warm-up time and resident memory of the shared model"""
+    return {"version": MODEL_VERSION, "loaded": _model is not None, **_stats}
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    warm_up()
+    print(get_model_stats())
@@ -0,0 +1,132 @@
+"""Fetch and verify model artifacts listed in model_cache/manifest.json.
+
+Run before serving so no request ever waits on a download:
+
+    python -m utils.model_fetch
+    DRAWEE_MODEL_MIRROR=/srv/models python -m utils.model_fetch
+"""
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+
+from utils.config import MODEL_MIRROR
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_PATH = "model_cache/manifest.json"
+
+
+class ModelArtifactError(Exception):
+    pass
+
+
+def load_manifest(path: str = MANIFEST_PATH) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stamp_path(path: str) -> str:
+    return f"{path}.verified"
+
+
+def _file_stamp(path: str, sha256: str) -> str:
+    stat = os.stat(path)
+    return f"{sha256} {stat.st_size} {stat.st_mtime_ns}"
+
+
+def is_verified(path: str, entry: dict) -> bool:
+    """Check size and SHA-256, skipping the hash if the file is unchanged since it last passed"""
+    if not os.path.exists(path) or os.path.getsize(path) != entry["size"]:
+        return False
+    try:
+        with open(_stamp_path(path)) as f:
+            if f.read().strip() == _file_stamp(path, entry["sha256"]):
+                return True
+    except OSError:
+        pass
+    if sha256_file(path) != entry["sha256"]:
+        return False
+    with open(_stamp_path(path), "w") as f:
+        f.write(_file_stamp(path, entry["sha256"]))
+    return True
+
+
+def _fetch_to(tmp_path: str, entry: dict, mirror: str):
+    if mirror:
+        source = os.path.join(mirror, os.path.basename(entry["path"])) if os.path.isdir(mirror) else mirror
+        logger.info("Copying %s from mirror %s", entry["path"], source)
+        shutil.copyfile(source, tmp_path)
+    else:
+        import gdown
+
+        logger.info("Downloading %s from %s", entry["path"], entry["url"])
+        gdown.download(entry["url"], tmp_path, quiet=False)
+
+
+def ensure_artifact(entry: dict, mirror: str = MODEL_MIRROR) -> str:
+    """Make sure a verified copy of an artifact is in place and return its path
+
+    The file is fetched into a temporary file next to the target, checked against
+    the manifest and only then renamed over the target, so readers never see a
+    partial or unverified model.
+    """
+    path = entry["path"]
+    if is_verified(path, entry):
+        return path
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".fetch-")
+    os.close(fd)
+    try:
+        _fetch_to(tmp_path, entry, mirror)
+        size = os.path.getsize(tmp_path)
+        if size != entry["size"]:
+            raise ModelArtifactError(f"{path}: expected {entry['size']} bytes, got {size}")
+        sha256 = sha256_file(tmp_path)
+        if sha256 != entry["sha256"]:
+            raise ModelArtifactError(f"{path}: checksum mismatch ({sha256})")
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    with open(_stamp_path(path), "w") as f:
+        f.write(_file_stamp(path, entry["sha256"]))
+    logger.info("Verified %s", path)
+    return path
+
+
+def artifact_ready(backend: str) -> bool:
+    """Check whether the manifest artifact for a backend is in place and verified, without fetching it"""
+    entry = load_manifest()["artifacts"].get(backend)
+    return entry is None or is_verified(entry["path"], entry)
+
+
+def ensure_model(backend: str, mirror: str = MODEL_MIRROR):
+    """Fetch the manifest artifact for a backend, if the manifest lists one"""
+    entry = load_manifest()["artifacts"].get(backend)
+    if entry is not None:
+        ensure_artifact(entry, mirror)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    manifest = load_manifest()
+    for backend, entry in manifest["artifacts"].items():
+        ensure_artifact(entry)
+        print(f"{manifest['version']} {backend}: {entry['path']} OK")
+
+
+if __name__ == "__main__":
+    main()
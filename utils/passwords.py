@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from utils import metrics
+from utils.config import BCRYPT_ROUNDS, PASSWORD_WORKERS, PASSWORD_QUEUE_SIZE, PASSWORD_QUEUE_TIMEOUT
+
+
+class PasswordPoolBusy(Exception):
+    """Raised when too many password checks are already queued"""
+
+
+# bcrypt releases the GIL, so a small dedicated pool caps how many cores auth can take from inference
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_WORKERS, thread_name_prefix="drawee-bcrypt")
+_slots = threading.BoundedSemaphore(PASSWORD_WORKERS + PASSWORD_QUEUE_SIZE)
+# Exported through utils.metrics; queue depth is what to alert on
+_queued = metrics.gauge("drawee_password_pool_jobs", state="queued")
+_running = metrics.gauge("drawee_password_pool_jobs", state="running")
+_completed = metrics.counter("drawee_password_pool_completed_total")
+_rejected = metrics.counter("drawee_password_pool_rejected_total")
+
+
+def _run(fn, *args):
+    _queued.dec()
+    _running.inc()
+    try:
+        return fn(*args)
+    finally:
+        _running.dec()
+        _completed.inc()
+
+
+def _submit(fn, *args):
+    # Back-pressure: wait briefly for a slot, then fail fast instead of piling up
+    if not _slots.acquire(timeout=PASSWORD_QUEUE_TIMEOUT):
+        _rejected.inc()
+        raise PasswordPoolBusy("Too many sign-ins at once. Please try again in a few seconds.")
+
+    _queued.inc()
+    future = _executor.submit(_run, fn, *args)
+    future.add_done_callback(lambda _: _slots.release())
+    return future.result()
+
+
+def hash_password(password: str) -> str:
+    """Hash a password on the bcrypt pool with the configured work factor"""
+    return _submit(lambda: bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode())
+
+
+def check_password(password: str, hashed: str) -> bool:
+    """Verify a password against its bcrypt hash on the bcrypt pool"""
+    return _submit(bcrypt.checkpw, password.encode(), hashed.encode())
+
+
+def get_password_pool_stats() -> dict:
+    """Return queue depth, running and completed counts, and rejections"""
+    return {
+        "queued": _queued.value,
+        "running": _running.value,
+        "completed": _completed.value,
+        "rejected": _rejected.value,
+        "workers": PASSWORD_WORKERS,
+        "max_queue": PASSWORD_QUEUE_SIZE,
+    }
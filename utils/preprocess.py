@@ -0,0 +1,122 @@
+import io
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.config import PREPROCESS_INTERPOLATION, MAX_IMAGE_PIXELS, MAX_IMAGE_PIXELS_SLACK, MAX_UPLOAD_PIXELS
+
+# v.7 (Xception Model)
+INPUT_SIZE = (256, 256)
+
+INTERPOLATIONS = {
+    "nearest": cv2.INTER_NEAREST,
+    "linear": cv2.INTER_LINEAR,
+    "area": cv2.INTER_AREA,
+    "cubic": cv2.INTER_CUBIC,
+}
+
+# JPEG scale-on-decode, largest reduction first
+_REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+_SCALE = np.float32(1.0 / 255.0)
+
+
+def probe_image(data: bytes):
+    """Read the format and size from the image header without decoding pixels"""
+    try:
+        with Image.open(io.BytesIO(data)) as im:
+            return im.format, im.size
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ValueError("Unsupported or corrupt image file.") from e
+
+
+def _decode_flag(image_format: str, width: int, height: int, max_pixels: int) -> int:
+    if image_format == "JPEG":
+        # Pick the strongest reduction that still leaves at least max_pixels to downscale from
+        for factor, flag in _REDUCED_DECODE_FLAGS:
+            if (width // factor) * (height // factor) >= max_pixels:
+                return flag
+    return cv2.IMREAD_COLOR
+
+
+def limit_pixels(img: np.ndarray, max_pixels: int = MAX_IMAGE_PIXELS, slack: float = MAX_IMAGE_PIXELS_SLACK) -> np.ndarray:
+    """Downscale an image so it has at most max_pixels, keeping the aspect ratio
+
+    Images within slack of the cap are returned as they are. Larger ones are
+    first shrunk by a whole factor with INTER_AREA, which OpenCV does cheaply,
+    and the remaining less-than-2x step uses INTER_LINEAR.
+    """
+    height, width = img.shape[:2]
+    if width * height <= max_pixels * (1 + slack):
+        return img
+    scale = (max_pixels / (width * height)) ** 0.5
+    factor = int(1 / scale)
+    if factor >= 2:
+        img = cv2.resize(img, (max(1, width // factor), max(1, height // factor)), interpolation=cv2.INTER_AREA)
+        height, width = img.shape[:2]
+        if width * height <= max_pixels * (1 + slack):
+            return img
+        scale = (max_pixels / (width * height)) ** 0.5
+    size = (max(1, int(width * scale)), max(1, int(height * scale)))
+    return cv2.resize(img, size, interpolation=cv2.INTER_LINEAR)
+
+
+def decode_image(data: bytes, max_pixels: int = MAX_IMAGE_PIXELS) -> np.ndarray:
+    """Decode upload bytes into an RGB uint8 array of about max_pixels at most
+
+    JPEGs are decoded at a reduced scale when they are far above the cap, and
+    images within MAX_IMAGE_PIXELS_SLACK of it are not resized at all. OpenCV
+    applies the EXIF orientation while decoding and the metadata itself is dropped.
+    """
+    image_format, (width, height) = probe_image(data)
+    if width * height > MAX_UPLOAD_PIXELS:
+        raise ValueError(f"Image is too large ({width}x{height}).")
+
+    flag = _decode_flag(image_format, width, height, max_pixels)
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+    if img is None:
+        raise ValueError("Unsupported or corrupt image file.")
+    img = limit_pixels(img, max_pixels)
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)
+
+
+def preprocess_into(img: np.ndarray, out: np.ndarray, interpolation: str = PREPROCESS_INTERPOLATION) -> np.ndarray:
+    """Resize an RGB image to the model input and normalize it into a float32 buffer"""
+    resized = cv2.resize(img, INPUT_SIZE, interpolation=INTERPOLATIONS[interpolation])
+    np.multiply(resized, _SCALE, out=out, dtype=np.float32)
+    return out
+
+
+def preprocess_image(img: np.ndarray, interpolation: str = PREPROCESS_INTERPOLATION) -> np.ndarray:
+    """Return a (256, 256, 3) float32 model input for one RGB image"""
+    out = np.empty((*INPUT_SIZE[::-1], 3), dtype=np.float32)
+    return preprocess_into(img, out, interpolation)
+
+
+def allocate_batch(n: int) -> np.ndarray:
+    """Allocate an (N, 256, 256, 3) float32 batch to preprocess into"""
+    return np.empty((n, *INPUT_SIZE[::-1], 3), dtype=np.float32)
+
+
+def make_thumbnail(img: np.ndarray, size: int, quality: int = 80) -> bytes:
+    """Encode an RGB array as a WebP thumbnail whose longest side is at most size"""
+    height, width = img.shape[:2]
+    scale = min(1.0, size / max(width, height))
+    thumb = cv2.resize(img, (max(1, round(width * scale)), max(1, round(height * scale))), interpolation=cv2.INTER_AREA)
+    ok, buf = cv2.imencode(".webp", cv2.cvtColor(thumb, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_WEBP_QUALITY, quality])
+    if not ok:
+        raise ValueError("Failed to encode thumbnail.")
+    return buf.tobytes()
+
+
+def encode_png(img: np.ndarray) -> bytes:
+    """Encode an RGB array as PNG bytes for storage"""
+    ok, buf = cv2.imencode(".png", cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+    if not ok:
+        raise ValueError("Failed to encode image as PNG.")
+    return buf.tobytes()
@@ -0,0 +1,225 @@
+"""Reads and writes for the children, results and users tables.
+
+Reads are memoized for the current script run, so identical queries made by
+different parts of a page hit Supabase once, and kept for a short TTL across
+reruns. Every write drops the cached reads it can affect.
+"""
+import uuid
+import time
+import threading
+
+import streamlit as st
+
+from utils import auth
+from utils.config import QUERY_CACHE_TTL
+
+_cache = {}
+_cache_lock = threading.Lock()
+# Bumped by every invalidation, so a fetch that raced a write is not cached
+_generation = 0
+_MEMO_KEY = "_repository_memo"
+
+
+def _request_memo():
+    # Only script runs have a request scope; worker threads share the TTL cache alone
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+    except ImportError:
+        return None
+    if get_script_run_ctx() is None:
+        return None
+    return st.session_state.setdefault(_MEMO_KEY, {})
+
+
+def begin_request():
+    """Start a new request scope; call once at the top of every page run"""
+    if _request_memo() is not None:
+        st.session_state[_MEMO_KEY] = {}
+
+
+def _read(key: tuple, fetch, ttl=QUERY_CACHE_TTL):
+    """Return fetch() for key, reusing this run's result or a cached one younger than ttl
+
+    The TTL also bounds staleness from writes made by other processes, which
+    cannot invalidate this one's cache.
+    """
+    memo = _request_memo()
+    if memo is not None and key in memo:
+        return memo[key]
+
+    now = time.monotonic()
+    with _cache_lock:
+        cached = _cache.get(key)
+        generation = _generation
+    if cached is not None and cached[0] > now:
+        value = cached[1]
+    else:
+        value = fetch()
+        if ttl > 0:
+            with _cache_lock:
+                # An invalidation during the fetch may have come after what it read
+                if generation == _generation:
+                    _cache[key] = (now + ttl, value)
+
+    if memo is not None:
+        memo[key] = value
+    return value
+
+
+def _invalidate(*prefix):
+    """Drop cached and memoized reads whose key starts with prefix"""
+    global _generation
+    with _cache_lock:
+        _generation += 1
+        for key in [k for k in _cache if k[:len(prefix)] == prefix]:
+            del _cache[key]
+    memo = _request_memo()
+    if memo is not None:
+        for key in [k for k in memo if k[:len(prefix)] == prefix]:
+            del memo[key]
+
+
+def _admin():
+    return auth.get_supabase_admin_client()
+
+
+# --- Children ---
+
+def list_children(user_id) -> list:
+    """Return the id and name of every child of a user"""
+    return _read(("children", user_id, "list"), lambda: _admin().table("children")
+                 .select("id, name").eq("user_id", user_id).execute().data or [])
+
+
+def get_child(user_id, child_id):
+    """Return a child owned by the user, or None"""
+    return next((child for child in list_children(user_id) if child["id"] == child_id), None)
+
+
+def get_or_create_child(user_id, name: str) -> str:
+    """Return the id of the user's child with this name, creating the child if needed"""
+    child = next((child for child in list_children(user_id) if child["name"] == name), None)
+    if child:
+        return child["id"]
+
+    child_id = str(uuid.uuid4())
+    _admin().table("children").insert({
+        "id": child_id,
+        "user_id": user_id,
+        "name": name
+    }).execute()
+    _invalidate("children", user_id)
+    return child_id
+
+
+def delete_child(user_id, child_id):
+    """Delete a child of the user and all of its results
+
+    Returns the deleted results rows, or None if the child is not theirs.
+    """
+    if get_child(user_id, child_id) is None:
+        return None
+    response = _admin().table("results").delete().eq("child_id", child_id).execute()
+    _admin().table("children").delete().eq("id", child_id).eq("user_id", user_id).execute()
+    invalidate_results(user_id, child_id)
+    return response.data or []
+
+
+def get_children_summary(user_id) -> list:
+    """Return each child's id, name, record count and last analysis date in one query"""
+    return _read(("children", user_id, "summary"), lambda: _admin().table("children_summary")
+                 .select("id, name, record_count, last_analyzed_at")
+                 .eq("user_id", user_id).execute().data or [])
+
+
+# --- Results ---
+
+def insert_results(user_id, child_id, rows: list):
+    """Insert analysis results for a child in one request
+
+    Rows that carry an idempotency_key already in the table are skipped, so a
+    replayed insert is harmless.
+    """
+    _admin().table("results").upsert(
+        [{"user_id": user_id, "child_id": child_id, **row} for row in rows],
+        on_conflict="idempotency_key", ignore_duplicates=True,
+    ).execute()
+    invalidate_results(user_id, child_id)
+
+
+def delete_result(user_id, child_id, result_id):
+    """Delete one result; returns the deleted row, or None if Supabase reported none"""
+    response = _admin().table("results").delete().eq("id", result_id).eq("child_id", child_id).execute()
+    invalidate_results(user_id, child_id)
+    return response.data[0] if response.data else None
+
+
+def get_results_page(child_id, page_size: int, after=None) -> tuple:
+    """Return one page of a child's results, newest first, and the cursor for the next page
+
+    after is the (created_at, id) of the last row of the previous page.
+    """
+    query = _admin().table("results") \
+        .select("id, image_path, thumbnail_path, prediction, confidence, created_at") \
+        .eq("child_id", child_id)
+    if after:
+        created_at, result_id = after
+        query = query.or_(f'created_at.lt."{created_at}",and(created_at.eq."{created_at}",id.lt.{result_id})')
+
+    # Ask for one extra row to know whether another page exists
+    rows = query.order("created_at", desc=True).order("id", desc=True).limit(page_size + 1).execute().data or []
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, (rows[-1]["created_at"], rows[-1]["id"])
+
+
+def get_child_summary(child_id) -> dict:
+    """Return a child's stage counts, most common stage and per-day per-stage counts
+
+    The result is cached for QUERY_CACHE_TTL, or until a result for the
+    child is inserted or deleted in this process.
+    """
+    def fetch():
+        summary = _admin().rpc("child_records_summary", {"p_child_id": child_id}).execute().data
+        return summary or {"total": 0, "stage_counts": [], "most_common": None, "daily": []}
+
+    return _read(("results", child_id, "summary"), fetch)
+
+
+def referenced_drawings(digests: list) -> set:
+    """Return the subset of drawing content hashes that at least one result still points at"""
+    if not digests:
+        return set()
+    rows = _admin().rpc("referenced_drawings", {"p_digests": list(digests)}).execute().data or []
+    return {row["digest"] for row in rows}
+
+
+def invalidate_results(user_id, child_id):
+    """Drop cached reads after results for a child are inserted or deleted"""
+    _invalidate("children", user_id)
+    _invalidate("results", child_id)
+
+
+# --- Users ---
+# Auth reads are never cached: they carry password hashes and gate access.
+
+def find_user(username: str, columns: str = "id, username"):
+    """Return a user row by username, or None"""
+    response = auth.get_supabase_client().table("users").select(columns).eq("username", username).execute()
+    return response.data[0] if response.data else None
+
+
+def user_exists(user_id, username: str) -> bool:
+    """Whether a user with this id and username still exists"""
+    response = auth.get_supabase_client().table("users").select("id").eq("id", user_id).eq("username", username).execute()
+    return bool(response.data)
+
+
+def create_user(username: str, password_hash: str) -> bool:
+    """Insert a new user; returns whether Supabase reported the insert"""
+    response = auth.get_supabase_client().table("users").insert({
+        "username": username,
+        "password": password_hash
+    }).execute()
+    return response.data is not None
@@ -0,0 +1,173 @@
+import time
+import random
+import logging
+
+import httpx
+from supabase import create_client
+try:
+    from supabase.lib.client_options import SyncClientOptions as ClientOptions
+except ImportError:
+    from supabase.lib.client_options import ClientOptions
+
+from utils import metrics
+from utils.config import (
+    SUPABASE_TIMEOUT, STORAGE_TIMEOUT, SUPABASE_MAX_CONNECTIONS, SUPABASE_KEEPALIVE_CONNECTIONS,
+    SUPABASE_KEEPALIVE_EXPIRY, SUPABASE_RETRIES, SUPABASE_RETRY_BASE_DELAY, SUPABASE_RETRY_MAX_DELAY,
+)
+
+logger = logging.getLogger(__name__)
+
+# Safe to repeat after any transient failure; inserts are only retried if the request never left
+IDEMPOTENT_OPERATIONS = {"select", "delete", "update", "upsert", "rpc", "remove", "list", "download", "get_public_url"}
+QUERY_OPERATIONS = {"select", "insert", "delete", "update", "upsert"}
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+def _status_code(exc):
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            continue
+    response = getattr(exc, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_transient(exc: Exception, operation: str) -> bool:
+    """Whether a failed call may be retried"""
+    if isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+        return True
+    if operation not in IDEMPOTENT_OPERATIONS:
+        return False
+    return isinstance(exc, httpx.TransportError) or _status_code(exc) in TRANSIENT_STATUS_CODES
+
+
+def call_with_retry(fn, target: str, operation: str, *args, **kwargs):
+    """Run one Supabase call with jittered exponential backoff, recording its latency"""
+    latency = metrics.histogram("drawee_supabase_request_seconds", target=target, operation=operation)
+    for attempt in range(SUPABASE_RETRIES + 1):
+        start = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            latency.observe(time.perf_counter() - start)
+            if attempt == SUPABASE_RETRIES or not is_transient(e, operation):
+                metrics.counter("drawee_supabase_errors_total", target=target, operation=operation).inc()
+                raise
+            metrics.counter("drawee_supabase_retries_total", target=target, operation=operation).inc()
+            # Full jitter keeps a burst of failing sessions from retrying in lockstep
+            delay = random.uniform(0, min(SUPABASE_RETRY_MAX_DELAY, SUPABASE_RETRY_BASE_DELAY * 2 ** attempt))
+            logger.warning("%s %s failed (%s), retrying in %.2fs", target, operation, e, delay)
+            time.sleep(delay)
+        else:
+            latency.observe(time.perf_counter() - start)
+            return result
+
+
+class InstrumentedQuery:
+    """Wraps a PostgREST request builder so execute() is timed and retried"""
+
+    def __init__(self, builder, target: str, operation: str):
+        self._builder = builder
+        self._target = target
+        self._operation = operation
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        operation = name if name in QUERY_OPERATIONS else self._operation
+        if hasattr(attr, "execute"):
+            return InstrumentedQuery(attr, self._target, operation)
+        if not callable(attr):
+            return attr
+
+        def chain(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            if hasattr(result, "execute"):
+                return InstrumentedQuery(result, self._target, operation)
+            return result
+        return chain
+
+    def execute(self):
+        return call_with_retry(self._builder.execute, self._target, self._operation)
+
+
+class InstrumentedBucket:
+    """Wraps a storage bucket so every file operation is timed and retried"""
+
+    def __init__(self, bucket, name: str):
+        self._bucket = bucket
+        self._name = name
+
+    def __getattr__(self, name):
+        attr = getattr(self._bucket, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return call_with_retry(attr, f"storage:{self._name}", name, *args, **kwargs)
+        return call
+
+
+class InstrumentedStorage:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def from_(self, bucket: str):
+        return InstrumentedBucket(self._storage.from_(bucket), bucket)
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+class InstrumentedClient:
+    """A Supabase client whose table, rpc and storage calls go through call_with_retry
+
+    storage_client, if given, serves storage calls, e.g. so uploads get a
+    longer timeout than queries.
+    """
+
+    def __init__(self, client, storage_client=None):
+        self._client = client
+        self._storage_client = storage_client or client
+
+    def table(self, name: str):
+        return InstrumentedQuery(self._client.table(name), name, "select")
+
+    def rpc(self, fn: str, params: dict = None):
+        return InstrumentedQuery(self._client.rpc(fn, params or {}), f"rpc:{fn}", "rpc")
+
+    @property
+    def storage(self):
+        return InstrumentedStorage(self._storage_client.storage)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def _client_options(timeout: float) -> ClientOptions:
+    options = dict(postgrest_client_timeout=SUPABASE_TIMEOUT, storage_client_timeout=STORAGE_TIMEOUT)
+    # One pooled keep-alive connection set per client, where the installed supabase-py accepts it.
+    # Its timeout then applies to every request, whatever the per-service timeouts say.
+    http_client = httpx.Client(
+        timeout=httpx.Timeout(timeout, connect=min(5.0, timeout)),
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=SUPABASE_KEEPALIVE_EXPIRY,
+        ),
+    )
+    try:
+        return ClientOptions(**options, httpx_client=http_client)
+    except TypeError:
+        http_client.close()
+        return ClientOptions(**options)
+
+
+def create_supabase_client(url: str, key: str) -> InstrumentedClient:
+    """Create a Supabase client with pooled connections, timeouts, retries and latency metrics"""
+    # Storage gets its own pool, so uploads wait STORAGE_TIMEOUT and queries SUPABASE_TIMEOUT
+    return InstrumentedClient(
+        create_client(url, key, options=_client_options(SUPABASE_TIMEOUT)),
+        storage_client=create_client(url, key, options=_client_options(STORAGE_TIMEOUT)),
+    )